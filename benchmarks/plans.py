@@ -0,0 +1,89 @@
+import re
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import Sum
+
+from houses.models import House, Bill, Payment, RoommateBalance
+from houses.views import PAYMENT_HISTORY_PAGE_SIZE
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN (ANALYZE, FORMAT JSON) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+# SQLite reports full scans as "SCAN [TABLE] name" unless an index is used
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def hot_querysets(house):
+    # The querysets behind the busiest model methods and views, built the
+    # same way the app builds them
+    roommate = house.roommate_set.order_by('id').first()
+    bill = house.bill_set.order_by('id').first()
+    querysets = OrderedDict([
+        ('house_detail.house', House.objects.filter(creator_id=house.creator_id, pk=house.id)),
+        ('house_detail.bills', house.bill_set.with_totals()),
+        ('house.balance_matrix', house.balance_rows()),
+        ('house_overdue.payments', Payment.objects.overdue().filter(bill__house_id=house.id)),
+    ])
+    if roommate:
+        querysets.update([
+            ('roommate.amounts_owed_from_roommates', RoommateBalance.objects.owed_from_roommates(roommate)),
+            ('roommate.amounts_owed_to_roommates', RoommateBalance.objects.owed_to_roommates(roommate)),
+            ('roommate.payment_history', roommate.payment_history()[:PAYMENT_HISTORY_PAGE_SIZE + 1]),
+        ])
+    if bill:
+        querysets.update([
+            # Bill.amount_due without annotations aggregates its payments
+            ('bill.amount_due', bill.payment_set.order_by().values('bill_id').annotate(Sum('amount_paid'))),
+            ('bill_detail.bill', Bill.objects.with_totals().filter(house_id=house.id, pk=bill.id)),
+            ('bill_detail.payments', bill.payment_set.select_related('payer')),
+        ])
+    return querysets
+
+
+def explain(queryset):
+    connection = connections[queryset.db]
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(EXPLAIN_PREFIXES.get(connection.vendor, 'EXPLAIN ') + sql, params)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+
+    if connection.vendor == 'postgresql':
+        plan = rows[0][0][0]
+        seq_scans = [
+            {'table': node['Relation Name'], 'filter': node.get('Filter'), 'rows': node.get('Actual Rows')}
+            for node in plan_nodes(plan['Plan'])
+            if node['Node Type'] == 'Seq Scan'
+        ]
+    elif connection.vendor == 'sqlite':
+        plan = [row[-1] for row in rows]
+        seq_scans = [
+            {'table': match.group(1), 'filter': None, 'rows': None}
+            for match in (SQLITE_SCAN.match(detail) for detail in plan)
+            if match
+        ]
+    else:
+        # MySQL marks full table scans with an access type of ALL
+        plan = [dict(zip(columns, row)) for row in rows]
+        seq_scans = [
+            {'table': row['table'], 'filter': None, 'rows': row.get('rows')}
+            for row in plan
+            if row.get('type') == 'ALL'
+        ]
+    return {'sql': sql, 'params': [str(param) for param in params], 'plan': plan, 'seq_scans': seq_scans}
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def explain_hotpaths(house):
+    return OrderedDict(
+        (name, explain(queryset))
+        for name, queryset in hot_querysets(house).items()
+    )
@@ -0,0 +1,40 @@
+import importlib
+import importlib._bootstrap as bootstrap
+import json
+import sys
+import time
+
+
+def profile_imports(module):
+    # Import module and time every module it pulls in, like python -X
+    # importtime on newer Pythons. Returns (name, self seconds, cumulative
+    # seconds) per module as each finishes loading. Run in a fresh
+    # interpreter, as only modules that aren't loaded yet are timed.
+    timings = []
+    stack = []
+    find_and_load = bootstrap._find_and_load
+
+    def timed_find_and_load(name, import_):
+        if name in sys.modules:
+            return find_and_load(name, import_)
+        stack.append(0)
+        start = time.perf_counter()
+        try:
+            return find_and_load(name, import_)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            timings.append((name, elapsed - children, elapsed))
+
+    bootstrap._find_and_load = timed_find_and_load
+    try:
+        importlib.import_module(module)
+    finally:
+        bootstrap._find_and_load = find_and_load
+    return timings
+
+
+if __name__ == '__main__':
+    json.dump(profile_imports(sys.argv[1]), sys.stdout)
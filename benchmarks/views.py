@@ -0,0 +1,140 @@
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.db import check_connections
+from houses import urls
+
+
+def view_args(house):
+    roommate = house.roommate_set.order_by('id').first()
+    bill = house.bill_set.order_by('id').first()
+    payment = bill.payment_set.order_by('id').first() if bill else None
+    args = {
+        'house_list': (),
+        'house_create': (),
+        'house_detail': (house.id,),
+        'house_delete': (house.id,),
+        'house_update': (house.id,),
+        'roommate_create': (house.id,),
+        'roommate_detail': (house.id, roommate.id),
+        'roommate_payment_history': (house.id, roommate.id),
+        'roommate_ledger_export': (house.id, roommate.id),
+        'house_ledger_export': (house.id,),
+        'house_ledger_import': (house.id,),
+        'house_overdue': (house.id,),
+        'user_overdue': (),
+        'bill_create': (house.id,),
+        'settle_up': (house.id,),
+        'settle_up_json': (house.id,),
+    }
+    if bill:
+        args['bill_detail'] = (house.id, bill.id)
+        args['payment_event_create'] = (house.id, payment.id)
+        args['payment_redirect'] = (payment.id,)
+    return args
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def time_view(client, url, iterations):
+    # tracemalloc hooks every allocation, so latency and queries are taken
+    # without it and memory from one more request afterwards. Queries are
+    # counted on every database, replicas and shards included.
+    timings = []
+    query_counts = []
+    for i in range(iterations):
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(conn)) for conn in connections.all()]
+            start = time.perf_counter()
+            response = get(client, url)
+            timings.append(time.perf_counter() - start)
+        query_counts.append(sum(len(queries) for queries in captured))
+    tracemalloc.start()
+    try:
+        get(client, url)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'url': url,
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'queries': percentile(query_counts, 50),
+        'max_queries': max(query_counts),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def get(client, url):
+    # Streamed responses run their queries as the body is read
+    response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def time_views(house, iterations):
+    # GET every view in houses/urls.py as the house's creator
+    client = Client()
+    client.force_login(house.creator)
+    args = view_args(house)
+    results = {}
+    for pattern in urls.urlpatterns:
+        if pattern.name not in args:
+            results[pattern.name] = {'skipped': True}
+            continue
+        results[pattern.name] = time_view(client, reverse(pattern.name, args=args[pattern.name]), iterations)
+    return results
+
+
+def time_connection_reuse(house, conn_max_ages, iterations, view_name='house_list'):
+    # Time one cheap view under each CONN_MAX_AGE. The test client skips
+    # Django's per-request connection handling, so run it here the way the
+    # WSGI handler does.
+    client = Client()
+    client.force_login(house.creator)
+    url = reverse(view_name, args=view_args(house)[view_name])
+    connects = []
+
+    def count_connect(sender, connection, **kwargs):
+        connects.append(connection.alias)
+
+    original = connection.settings_dict['CONN_MAX_AGE']
+    connection_created.connect(count_connect)
+    results = {}
+    try:
+        for conn_max_age in conn_max_ages:
+            connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+            connection.close()
+            del connects[:]
+            timings = []
+            for i in range(iterations):
+                start = time.perf_counter()
+                close_old_connections()
+                check_connections()
+                client.get(url)
+                close_old_connections()
+                timings.append(time.perf_counter() - start)
+            results[str(conn_max_age)] = {
+                'url': url,
+                'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                'p95_ms': round(percentile(timings, 95) * 1000, 3),
+                'connects': len(connects),
+            }
+    finally:
+        connection_created.disconnect(count_connect)
+        connection.settings_dict['CONN_MAX_AGE'] = original
+        connection.close()
+    return results
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+class CoreConfig(AppConfig):
+    name = 'core'
+
+    def ready(self):
+        from .db import check_connections
+        request_started.connect(check_connections, dispatch_uid='core.check_connections')
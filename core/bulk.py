@@ -0,0 +1,33 @@
+from itertools import islice
+
+from django.db import connections, router, transaction
+
+
+def bulk_insert(model, objs, using=None):
+    # bulk_create sets primary keys on backends that return them, like
+    # PostgreSQL. On SQLite the insert holds the database's write lock until
+    # the transaction ends, so reading the newest ids back before then gets
+    # exactly the rows just inserted.
+    if not objs:
+        return objs
+    using = using or router.db_for_write(model)
+    with transaction.atomic(using=using):
+        model.objects.using(using).bulk_create(objs)
+        if objs[0].pk is None:
+            if connections[using].vendor != 'sqlite':
+                raise NotImplementedError('bulk_insert needs SQLite or PostgreSQL, not {}'.format(
+                    connections[using].vendor,
+                ))
+            ids = model.objects.using(using).order_by('-id').values_list('id', flat=True)[:len(objs)]
+            for obj, obj_id in zip(objs, reversed(list(ids))):
+                obj.id = obj_id
+    return objs
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,20 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+
+
+class ReadOnlyCache(DummyCache):
+    # Reads go to the cache alias named as LOCATION; writes are dropped.
+    # For pages rendered from a replica, which may serve what is already
+    # cached but must not cache what they render themselves.
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.alias = location
+
+    def get(self, key, default=None, version=None):
+        return caches[self.alias].get(key, default, version)
+
+    def get_many(self, keys, version=None):
+        return caches[self.alias].get_many(keys, version)
+
+    def has_key(self, key, version=None):
+        return caches[self.alias].has_key(key, version)
@@ -0,0 +1,42 @@
+import logging
+import time
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def check_connections(**kwargs):
+    # Runs on request_started, after Django has closed obsolete connections.
+    # A persistent connection can still have been dropped by the server
+    # while idle, which Django 1.11 only notices when a query fails.
+    for connection in connections.all():
+        if connection.connection is None or not connection.settings_dict.get('CONN_HEALTH_CHECKS'):
+            continue
+        if connection.settings_dict.get('CONN_MAX_AGE') == 0:
+            continue
+        if not connection.is_usable():
+            logger.warning('Closing unusable connection to %s', connection.alias)
+            connection.close()
+
+
+def warm_up_connections():
+    # Connect every database and check the connection works, returning the
+    # seconds each took. Failures are logged so a database that is down at
+    # boot doesn't stop the worker; the first request will try again.
+    timings = {}
+    for connection in connections.all():
+        if connection.settings_dict.get('CONN_MAX_AGE') == 0:
+            # Django would close it again at the start of the first request
+            continue
+        start = time.perf_counter()
+        try:
+            connection.ensure_connection()
+            if not connection.is_usable():
+                raise RuntimeError('connection is not usable')
+        except Exception:
+            logger.exception('Could not warm up connection to %s', connection.alias)
+            connection.close()
+            continue
+        timings[connection.alias] = time.perf_counter() - start
+    return timings
@@ -1,9 +1,25 @@
+import random
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+import factory
+import factory.random
 from faker import Faker
 
+from django.contrib.auth.hashers import make_password
+from django.db import router, transaction
+
+from core.bulk import bulk_insert
+from houses.models import House, Roommate, Bill, Payment, PaymentEvent, RoommateBalance
+from houses.sharding import use_shard
+from houses.splits import EqualSplit
 from users.models import User
 
 fake = Faker()
 
+BILL_NAMES = ['Rent', 'Electric', 'Heat', 'Water', 'Internet', 'Groceries']
+
 
 def create_fake_user():
     return User.objects.create_user(
@@ -11,3 +27,136 @@ def create_fake_user():
         fake.email(),
         fake.password(),
     )
+
+
+class UserFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = User
+
+    username = factory.LazyFunction(lambda: '{}-{}'.format(fake.user_name(), uuid.uuid4().hex[:8]))
+    email = factory.Faker('email')
+    password = factory.LazyFunction(lambda: make_password(None))
+
+
+class HouseFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = House
+
+    name = factory.Faker('street_address')
+    creator = factory.SubFactory(UserFactory)
+
+
+class RoommateFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Roommate
+
+    name = factory.Faker('first_name')
+    house = factory.SubFactory(HouseFactory)
+
+
+class BillFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Bill
+
+    name = factory.Iterator(BILL_NAMES)
+    amount = factory.LazyFunction(lambda: Decimal(factory.random.randgen.randint(1000, 99999)) / 100)
+    owner = factory.SubFactory(RoommateFactory)
+    house = factory.SelfAttribute('owner.house')
+
+
+class PaymentFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Payment
+
+    bill = factory.SubFactory(BillFactory)
+    payer = factory.SubFactory(RoommateFactory, house=factory.SelfAttribute('..bill.house'))
+    amount = factory.SelfAttribute('bill.amount')
+    amount_paid = Decimal('0.00')
+
+
+class PaymentEventFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = PaymentEvent
+
+    payment = factory.SubFactory(PaymentFactory)
+    amount = Decimal('1.00')
+
+
+def bulk_create_batch(factory_class, size, batch_size=1000, **kwargs):
+    # Like factory_class.create_batch() but with one INSERT per batch
+    objs = []
+    for start in range(0, size, batch_size):
+        batch = factory_class.build_batch(min(batch_size, size - start), **kwargs)
+        with transaction.atomic(using=router.db_for_write(factory_class._meta.model)):
+            objs.extend(bulk_insert(factory_class._meta.model, batch))
+    return objs
+
+
+def seed_house(roommates, bills, events, split_size=0, batch_size=1000, seed=None, creator=None):
+    # Bulk mode: one house with its roommates, bills split among split_size
+    # payers (the whole house if 0) and payment events, with no per-row
+    # queries. The balance ledger is rebuilt at the end.
+    rand = random.Random(seed)
+    with seeded_factories(seed):
+        house = HouseFactory(creator=creator or UserFactory())
+        with use_shard(house.shard):
+            seed_house_data(house, rand, roommates, bills, events, split_size, batch_size)
+    return house
+
+
+@contextmanager
+def seeded_factories(seed):
+    # Seed factory_boy's generator, the one every Faker instance shares and
+    # the bill name cycle, then put the generators back so nothing after
+    # the block gets repeatable data by accident
+    if seed is None:
+        yield
+        return
+    factory_state, faker_state = factory.random.get_random_state(), fake.random.getstate()
+    factory.random.reseed_random(seed)
+    Faker.seed(seed)
+    BillFactory.name.reset()
+    try:
+        yield
+    finally:
+        factory.random.set_random_state(factory_state)
+        fake.random.setstate(faker_state)
+
+
+def seed_house_data(house, rand, roommates, bills, events, split_size, batch_size):
+    members = bulk_create_batch(RoommateFactory, roommates, batch_size, house=house)
+    split_size = min(split_size or roommates, roommates)
+
+    for start in range(0, bills, batch_size):
+        count = min(batch_size, bills - start)
+        with transaction.atomic(using=router.db_for_write(Bill)):
+            batch = bulk_insert(Bill, BillFactory.build_batch(
+                count,
+                house=house,
+                owner=factory.LazyFunction(lambda: rand.choice(members)),
+            ))
+            payments = []
+            for bill in batch:
+                payers = rand.sample(members, split_size)
+                shares = EqualSplit().split(bill.amount, [payer.id for payer in payers])
+                payments.extend(
+                    Payment(bill=bill, payer_id=payer_id, amount=amount, amount_paid=Decimal('0.00'))
+                    for payer_id, amount in shares.items()
+                )
+
+            # Spread this batch's share of the events over its payments and
+            # post them up front, since bulk_create skips PaymentEvent.save()
+            batch_events = events * (start + count) // bills - events * start // bills
+            posted = []
+            for i in range(batch_events):
+                payment = rand.choice(payments)
+                amount = min(payment.amount - payment.amount_paid, Decimal('5.00'))
+                if amount > 0:
+                    payment.amount_paid += amount
+                    posted.append((payment, amount))
+            bulk_insert(Payment, payments)
+            PaymentEvent.objects.bulk_create([
+                PaymentEvent(payment=payment, amount=amount) for payment, amount in posted
+            ])
+
+    RoommateBalance.objects.rebuild(house)
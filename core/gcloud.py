@@ -0,0 +1,49 @@
+import mimetypes
+from collections import OrderedDict
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin
+from django.utils.encoding import filepath_to_uri
+from storages.backends.gcloud import GoogleCloudStorage
+from storages.utils import clean_name
+
+from .storage import IMMUTABLE_CACHE_CONTROL, CompressedStaticFilesMixin
+
+
+class StaticGoogleCloudStorage(GoogleCloudStorage):
+    # Build URLs from STATIC_URL instead of fetching every blob for its
+    # public URL while a template renders
+    def url(self, name):
+        return urljoin(settings.STATIC_URL, filepath_to_uri(name))
+
+    def blob_name(self, name):
+        return self._encode_name(self._normalize_name(clean_name(name)))
+
+
+class CompressedManifestGoogleCloudStorage(CompressedStaticFilesMixin, ManifestFilesMixin, StaticGoogleCloudStorage):
+    # Cloud Storage serves one object per name and can't choose a variant
+    # by Accept-Encoding. It does decompress gzip objects for clients that
+    # don't accept gzip, so each hashed text file is replaced by its gzip
+    # variant with Content-Encoding: gzip. Every hashed object is marked
+    # immutable.
+    encodings = ('gzip',)
+
+    def compress(self, name):
+        # Left gzipped by an earlier collectstatic
+        if self._get_blob(self.blob_name(name)).content_encoding == 'gzip':
+            return OrderedDict()
+        return super().compress(name)
+
+    def save_compressed(self, name, variants):
+        if 'gzip' in variants:
+            blob = self.bucket.blob(self.blob_name(name))
+            blob.content_encoding = 'gzip'
+            blob.cache_control = IMMUTABLE_CACHE_CONTROL
+            blob.upload_from_string(variants['gzip'], content_type=mimetypes.guess_type(name)[0])
+            return [name]
+        blob = self._get_blob(self.blob_name(name))
+        if blob.cache_control != IMMUTABLE_CACHE_CONTROL:
+            blob.cache_control = IMMUTABLE_CACHE_CONTROL
+            blob.patch()
+        return []
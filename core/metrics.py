@@ -0,0 +1,97 @@
+import hashlib
+import re
+import threading
+from collections import Counter
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\(\?(?:, \?)+\)')
+
+
+def fingerprint(sql):
+    # Strip literals so the same query with different parameters (the
+    # signature of an N+1) collapses to one fingerprint
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    return IN_LIST_RE.sub('(...)', sql)
+
+
+def fingerprint_id(fingerprint):
+    return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:12]
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.duplicate_queries = 0
+        self.sql_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.duplicates = Counter()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.fingerprints = {}
+
+    def record(self, view, wall_seconds, queries):
+        counts = Counter(fingerprint(query['sql']) for query in queries)
+        duplicates = {sql: count - 1 for sql, count in counts.items() if count > 1}
+        sql_seconds = sum(float(query['time']) for query in queries)
+        with self.lock:
+            metrics = self.views.setdefault(view, ViewMetrics())
+            metrics.requests += 1
+            metrics.queries += len(queries)
+            metrics.max_queries = max(metrics.max_queries, len(queries))
+            metrics.sql_seconds += sql_seconds
+            metrics.wall_seconds += wall_seconds
+            for sql, count in duplicates.items():
+                key = fingerprint_id(sql)
+                self.fingerprints[key] = sql
+                metrics.duplicates[key] += count
+                metrics.duplicate_queries += count
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.fingerprints = {}
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        with self.lock:
+            views = sorted(self.views.items())
+            series = [
+                ('hausmate_requests_total', 'counter', 'Requests served.', 'requests'),
+                ('hausmate_queries_total', 'counter', 'SQL queries run.', 'queries'),
+                ('hausmate_queries_max', 'gauge', 'Most SQL queries run by one request.', 'max_queries'),
+                ('hausmate_duplicate_queries_total', 'counter',
+                 'SQL queries repeating an earlier query of the same request.', 'duplicate_queries'),
+                ('hausmate_sql_seconds_total', 'counter', 'Time spent in SQL.', 'sql_seconds'),
+                ('hausmate_request_seconds_total', 'counter', 'Wall time spent serving requests.', 'wall_seconds'),
+            ]
+            for name, kind, help_text, attr in series:
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                for view, metrics in views:
+                    lines.append('{}{{view="{}"}} {}'.format(name, escape_label(view), getattr(metrics, attr)))
+
+            name = 'hausmate_duplicate_query_fingerprint_total'
+            lines.append('# HELP {} Duplicate SQL queries by fingerprint.'.format(name))
+            lines.append('# TYPE {} counter'.format(name))
+            for view, metrics in views:
+                for key, count in metrics.duplicates.most_common():
+                    lines.append('{}{{view="{}",fingerprint="{}"}} {}'.format(name, escape_label(view), key, count))
+            for key, sql in sorted(self.fingerprints.items()):
+                lines.append('# fingerprint {} {}'.format(key, ' '.join(sql.split())))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.utils.deprecation import MiddlewareMixin
+
+from . import routers
+from .metrics import registry
+
+
+class QueryRecordingCursor(CursorWrapper):
+    # Records each query into the thread's current request, if any, with
+    # the same SQL Django's debug cursor would log
+    def execute(self, sql, params=None):
+        return self.record(super().execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.record(super().executemany, sql, param_list, many=True)
+
+    def record(self, run, sql, params, many=False):
+        queries = getattr(_recording, 'queries', None)
+        if queries is None:
+            return run(sql, params)
+        start = time.perf_counter()
+        try:
+            return run(sql, params)
+        finally:
+            if many:
+                try:
+                    sql = '{} times: {}'.format(len(params), sql)
+                except TypeError:
+                    pass
+            else:
+                sql = self.db.ops.last_executed_query(self.cursor, sql, params)
+            queries.append({'sql': sql, 'time': time.perf_counter() - start})
+
+
+_recording = threading.local()
+
+
+def record_queries(connection):
+    # Wrap every cursor the connection hands out until stop_recording().
+    # Connections belong to one thread, so this only affects the current one.
+    if getattr(connection, 'records_queries', False):
+        return
+    for name in ('make_cursor', 'make_debug_cursor'):
+        make_cursor = getattr(connection, name)
+        setattr(connection, name, lambda cursor, make_cursor=make_cursor: QueryRecordingCursor(
+            make_cursor(cursor), connection,
+        ))
+    connection.records_queries = True
+
+
+def stop_recording(connection):
+    # Drop the wrappers so the class's own cursor methods apply again
+    if getattr(connection, 'records_queries', False):
+        for name in ('make_cursor', 'make_debug_cursor'):
+            delattr(connection, name)
+        connection.records_queries = False
+
+
+class QueryMetricsMiddleware(MiddlewareMixin):
+    # Record query count, SQL time, duplicate queries and wall time per view.
+    # Queries are counted by a cursor wrapper as they run, including those
+    # run while a streaming response is consumed. Connections are only
+    # wrapped while a request is being recorded.
+    def __init__(self, get_response=None):
+        if not settings.QUERY_METRICS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        for connection in connections.all():
+            record_queries(connection)
+        _recording.queries = request._query_metrics = []
+        request._query_metrics_start = time.perf_counter()
+
+    def process_response(self, request, response):
+        queries = getattr(request, '_query_metrics', None)
+        if queries is None:
+            return response
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        if response.streaming:
+            response.streaming_content = self.record_after(response.streaming_content, request, view)
+        else:
+            self.record(request, view)
+        return response
+
+    def record_after(self, content, request, view):
+        try:
+            yield from content
+        finally:
+            self.record(request, view)
+
+    def record(self, request, view):
+        if getattr(_recording, 'queries', None) is request._query_metrics:
+            _recording.queries = None
+            for connection in connections.all():
+                stop_recording(connection)
+        registry.record(view, time.perf_counter() - request._query_metrics_start, request._query_metrics)
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    # A client that wrote keeps reading from the primary for
+    # REPLICA_PIN_SECONDS, so the page it is redirected to shows its change
+    # even if the replicas lag
+    cookie_name = 'primary_pin'
+
+    def process_request(self, request):
+        routers.reset(pinned=self.cookie_name in request.COOKIES)
+
+    def process_response(self, request, response):
+        if routers.wrote():
+            response.set_cookie(self.cookie_name, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+        routers.reset()
+        return response
@@ -0,0 +1,52 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_state = threading.local()
+
+
+@contextmanager
+def use_replicas():
+    # Send reads in this block to one replica, unless this thread has been
+    # pinned to the primary
+    previous = getattr(_state, 'replica', None)
+    if settings.DATABASE_REPLICAS:
+        _state.replica = random.choice(settings.DATABASE_REPLICAS)
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def reset(pinned=False):
+    _state.pinned = pinned
+    _state.wrote = False
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+class PrimaryReplicaRouter:
+    # Writes go to the primary and pin the thread to it, so a request reads
+    # its own writes. Reads go to a replica only inside use_replicas().
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if replica and not getattr(_state, 'pinned', False):
+            return replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _state.pinned = True
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards carry the full schema, like the primary
+        return db not in settings.DATABASE_REPLICAS
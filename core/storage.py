@@ -0,0 +1,97 @@
+import gzip
+import io
+from collections import OrderedDict
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Text formats; images and woff fonts are compressed already
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.eot', '.ttf')
+# Smaller files fit in a packet or two either way
+COMPRESS_MIN_SIZE = 256
+# Keep a variant only if it is at least 5% smaller
+COMPRESS_MAX_RATIO = 0.95
+
+ENCODING_SUFFIXES = OrderedDict([('br', '.br'), ('gzip', '.gz')])
+
+# Hashed names change with their content, so they can be cached forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def gzip_compress(data):
+    out = io.BytesIO()
+    # A fixed mtime keeps the output the same from one collectstatic to the next
+    with gzip.GzipFile(filename='', mode='wb', fileobj=out, compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def brotli_compress(data):
+    return brotli.compress(data, quality=11)
+
+
+COMPRESSORS = {'gzip': gzip_compress, 'br': brotli_compress}
+
+
+class CompressedStaticFilesMixin:
+    # Once the manifest storage has written its hashed files, compress each
+    # text file ahead of time. Requires the brotli package for br.
+    encodings = ('br', 'gzip')
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        self._immutable_names = None
+        # Only the final names, not the intermediate ones from earlier passes
+        for hashed_name in sorted(self.immutable_names):
+            for saved_name in self.save_compressed(hashed_name, self.compress(hashed_name)):
+                yield hashed_name, saved_name, True
+
+    def compress(self, name):
+        variants = OrderedDict()
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return variants
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return variants
+        for encoding in self.encodings:
+            if encoding == 'br' and brotli is None:
+                continue
+            compressed = COMPRESSORS[encoding](data)
+            if len(compressed) < len(data) * COMPRESS_MAX_RATIO:
+                variants[encoding] = compressed
+        return variants
+
+    def save_compressed(self, name, variants):
+        # Variants go next to the file as name.br and name.gz, the layout
+        # nginx's gzip_static and core.views.serve_static look for
+        saved_names = []
+        for encoding, data in variants.items():
+            variant_name = name + ENCODING_SUFFIXES[encoding]
+            if self.exists(variant_name):
+                self.delete(variant_name)
+            saved_names.append(self._save(variant_name, ContentFile(data)))
+        return saved_names
+
+    def is_immutable(self, name):
+        return name in self.immutable_names
+
+    @property
+    def immutable_names(self):
+        if getattr(self, '_immutable_names', None) is None:
+            self._immutable_names = {
+                hashed_name for name, hashed_name in self.hashed_files.items() if hashed_name != name
+            }
+        return self._immutable_names
+
+
+class CompressedManifestStaticFilesStorage(CompressedStaticFilesMixin, ManifestStaticFilesStorage):
+    pass
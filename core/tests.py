@@ -0,0 +1,306 @@
+import gzip
+import importlib
+import os
+import shutil
+import tempfile
+from unittest import mock, skipIf
+
+from faker import Faker
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connection
+from django.template import engines
+from django.test import RequestFactory, TestCase, SimpleTestCase, override_settings
+from django.urls import NoReverseMatch, reverse
+from django.http.response import HttpResponseRedirect, HttpResponse
+
+from core import factories
+from core import routers
+from core.db import check_connections, warm_up_connections
+from core.metrics import fingerprint, registry
+from core.middleware import QueryMetricsMiddleware
+from core.storage import IMMUTABLE_CACHE_CONTROL
+from core.views import metrics, serve_static
+from core.warmup import resolve_urls, warm_up
+from houses.models import House
+from houses import urls
+from settings import gunicorn as gunicorn_config
+
+fake = Faker()
+
+
+class FingerprintTest(SimpleTestCase):
+    def test_literals_are_stripped(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'o''brien'"),
+            'SELECT * FROM t WHERE id = ? AND name = ?',
+        )
+
+    def test_in_lists_are_collapsed(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (1, 2, 3)'),
+            fingerprint('SELECT * FROM t WHERE id IN (4, 5)'),
+        )
+
+
+@override_settings(
+    QUERY_METRICS=True,
+    MIDDLEWARE_CLASSES=['core.middleware.QueryMetricsMiddleware'] + [
+        name for name in settings.MIDDLEWARE_CLASSES if name != 'core.middleware.QueryMetricsMiddleware'
+    ],
+)
+class QueryMetricsMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = factories.create_fake_user()
+        cls.house = House.objects.create(name=fake.address(), creator=cls.user)
+
+    def setUp(self):
+        registry.reset()
+        self.client.force_login(self.user)
+        self.client.get(reverse('house_detail', args=(self.house.id,)))
+
+    def test_view_is_recorded(self):
+        metrics = registry.views['house_detail']
+        self.assertEqual(metrics.requests, 1)
+        self.assertGreater(metrics.queries, 0)
+        self.assertGreater(metrics.wall_seconds, 0)
+
+    def test_duplicate_queries_are_recorded(self):
+        registry.record('bill_detail', 0.1, [
+            {'sql': 'SELECT * FROM houses_roommate WHERE id = 1', 'time': '0.001'},
+            {'sql': 'SELECT * FROM houses_roommate WHERE id = 2', 'time': '0.001'},
+            {'sql': 'SELECT * FROM houses_roommate WHERE id = 3', 'time': '0.001'},
+        ])
+        metrics = registry.views['bill_detail']
+        self.assertEqual(metrics.duplicate_queries, 2)
+        self.assertIn('hausmate_duplicate_query_fingerprint_total{view="bill_detail"', registry.render())
+
+    def test_metrics_are_rendered(self):
+        output = registry.render()
+        self.assertIn('hausmate_requests_total{view="house_detail"} 1', output)
+
+    def test_queries_are_counted_once_the_query_log_is_full(self):
+        registry.reset()
+        connection.queries_log.extend({'sql': '', 'time': '0'} for i in range(connection.queries_limit))
+        self.client.get(reverse('house_detail', args=(self.house.id,)))
+        self.assertGreater(registry.views['house_detail'].queries, 0)
+
+    def test_connections_are_unwrapped_after_the_request(self):
+        self.assertNotIn('make_cursor', vars(connection))
+        self.assertNotIn('make_debug_cursor', vars(connection))
+
+    @override_settings(QUERY_METRICS=False)
+    def test_middleware_is_off_without_query_metrics(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryMetricsMiddleware()
+
+    def test_queries_run_while_streaming_are_counted(self):
+        registry.reset()
+        response = self.client.get(reverse('house_ledger_export', args=(self.house.id,)))
+        self.assertNotIn('house_ledger_export', registry.views)
+        b''.join(response.streaming_content)
+        # The bill, payment and event queries all run while streaming
+        self.assertGreaterEqual(registry.views['house_ledger_export'].queries, 3)
+
+
+class MetricsViewTest(TestCase):
+    def get(self, user):
+        request = RequestFactory().get('/metrics')
+        request.user = user
+        return metrics(request)
+
+    def test_anon_user_is_redirected(self):
+        response = self.get(AnonymousUser())
+        self.assertEqual(response.status_code, HttpResponseRedirect.status_code)
+
+    def test_staff_user_can_view(self):
+        user = factories.create_fake_user()
+        user.is_staff = True
+        response = self.get(user)
+        self.assertEqual(response.status_code, HttpResponse.status_code)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4')
+
+    @skipIf(settings.QUERY_METRICS, 'The route is registered when QUERY_METRICS is on')
+    def test_route_is_off_without_query_metrics(self):
+        with self.assertRaises(NoReverseMatch):
+            reverse('metrics')
+
+
+class CheckConnectionsTest(SimpleTestCase):
+    allow_database_queries = True
+
+    def setUp(self):
+        connection.ensure_connection()
+        patcher = mock.patch.dict(connection.settings_dict, CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unusable_connection_is_closed(self):
+        with mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close, \
+                self.assertLogs('core.db', 'WARNING'):
+            check_connections()
+        close.assert_called_once_with()
+
+    def test_usable_connection_is_kept(self):
+        with mock.patch.object(connection, 'close') as close:
+            check_connections()
+        close.assert_not_called()
+
+    def test_health_checks_can_be_turned_off(self):
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = False
+        with mock.patch.object(connection, 'is_usable') as is_usable:
+            check_connections()
+        is_usable.assert_not_called()
+
+
+class WarmUpConnectionsTest(SimpleTestCase):
+    allow_database_queries = True
+
+    def test_persistent_connections_are_opened(self):
+        with mock.patch.dict(connection.settings_dict, CONN_MAX_AGE=60):
+            self.assertIn('default', warm_up_connections())
+
+    def test_per_request_connections_are_skipped(self):
+        with mock.patch.dict(connection.settings_dict, CONN_MAX_AGE=0):
+            self.assertEqual(warm_up_connections(), {})
+
+
+class WarmUpTest(SimpleTestCase):
+    def test_templates_are_compiled_into_the_cache(self):
+        loader = engines['django'].engine.template_loaders[0]
+        loader.reset()
+        warm_up()
+        self.assertIn('houses/house_detail.html', loader.get_template_cache)
+        self.assertIn('admin/base.html', loader.get_template_cache)
+
+    def test_every_url_pattern_is_resolved(self):
+        self.assertGreater(resolve_urls(), len(urls.urlpatterns))
+
+
+class GunicornConfigTest(SimpleTestCase):
+    def test_sizing_comes_from_env(self):
+        self.addCleanup(importlib.reload, gunicorn_config)
+        with mock.patch.dict(os.environ, PORT='9000', GUNICORN_WORKERS='3', GUNICORN_THREADS='8'):
+            config = importlib.reload(gunicorn_config)
+        self.assertEqual((config.bind, config.workers, config.threads), (':9000', 3, 8))
+        self.assertTrue(config.preload_app)
+
+    def test_master_warms_up_before_forking(self):
+        with mock.patch('core.warmup.warm_up') as warm_up, \
+                mock.patch('django.db.connections.close_all') as close_all:
+            gunicorn_config.when_ready(None)
+        warm_up.assert_called_once_with()
+        close_all.assert_called_once_with()
+
+    def test_workers_connect_after_forking(self):
+        with mock.patch('core.db.warm_up_connections') as warm_up_connections:
+            gunicorn_config.post_worker_init(None)
+        warm_up_connections.assert_called_once_with()
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        routers.reset()
+        self.addCleanup(routers.reset)
+        self.router = routers.PrimaryReplicaRouter()
+
+    def test_reads_use_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(House), 'default')
+
+    def test_reads_use_replica_in_read_only_block(self):
+        with routers.use_replicas():
+            self.assertEqual(self.router.db_for_read(House), 'replica1')
+        self.assertEqual(self.router.db_for_read(House), 'default')
+
+    def test_reads_stick_to_primary_after_write(self):
+        with routers.use_replicas():
+            self.assertEqual(self.router.db_for_write(House), 'default')
+            self.assertEqual(self.router.db_for_read(House), 'default')
+        self.assertTrue(routers.wrote())
+
+    def test_pinned_requests_read_from_primary(self):
+        routers.reset(pinned=True)
+        with routers.use_replicas():
+            self.assertEqual(self.router.db_for_read(House), 'default')
+
+    def test_only_primary_is_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'houses'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'houses'))
+
+
+@override_settings(
+    MIDDLEWARE_CLASSES=['core.middleware.ReplicaPinMiddleware'] + settings.MIDDLEWARE_CLASSES,
+)
+class ReplicaPinMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = factories.create_fake_user()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post(reverse('house_create'), {'name': fake.address()})
+        self.assertEqual(response.cookies['primary_pin']['max-age'], settings.REPLICA_PIN_SECONDS)
+
+    def test_read_does_not_pin(self):
+        response = self.client.get(reverse('house_list'))
+        self.assertNotIn('primary_pin', response.cookies)
+
+
+class CompressedStaticFilesTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            STATIC_ROOT=cls.static_root,
+            STATICFILES_STORAGE='core.storage.CompressedManifestStaticFilesStorage',
+        )
+        cls.settings_override.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.css = staticfiles_storage.stored_name('admin/css/base.css')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.static_root)
+        super().tearDownClass()
+
+    def test_variants_are_written_next_to_hashed_files(self):
+        with staticfiles_storage.open(self.css) as f:
+            original = f.read()
+        with staticfiles_storage.open(self.css + '.gz') as f:
+            self.assertEqual(gzip.decompress(f.read()), original)
+        self.assertTrue(staticfiles_storage.exists(self.css + '.br'))
+        self.assertFalse(staticfiles_storage.exists('admin/css/base.css.gz'))
+
+    def test_compressed_formats_are_skipped(self):
+        font = staticfiles_storage.stored_name('admin/fonts/Roboto-Regular-webfont.woff')
+        self.assertFalse(staticfiles_storage.exists(font + '.gz'))
+
+    def test_hashed_files_are_served_compressed_and_immutable(self):
+        request = RequestFactory().get('/static/' + self.css, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        response = serve_static(request, self.css)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertIn('Expires', response)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_brotli_is_preferred(self):
+        request = RequestFactory().get('/static/' + self.css, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(serve_static(request, self.css)['Content-Encoding'], 'br')
+
+    def test_unhashed_files_are_not_immutable(self):
+        request = RequestFactory().get('/static/admin/css/base.css')
+        response = serve_static(request, 'admin/css/base.css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Cache-Control', response)
@@ -0,0 +1,39 @@
+import mimetypes
+import time
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import serve
+
+from .metrics import registry
+from .storage import ENCODING_SUFFIXES, IMMUTABLE_MAX_AGE
+
+
+@staff_member_required
+def metrics(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4')
+
+
+def serve_static(request, path):
+    # Serve collected static files when nothing sits in front of the app,
+    # with the precompressed variant the client accepts and hashed files
+    # cached for a year
+    accepted = {part.split(';')[0].strip() for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')}
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        if encoding in accepted and staticfiles_storage.exists(path + suffix):
+            response = serve(request, path + suffix, document_root=settings.STATIC_ROOT)
+            response['Content-Type'] = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response['Content-Encoding'] = encoding
+            break
+    else:
+        response = serve(request, path, document_root=settings.STATIC_ROOT)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    is_immutable = getattr(staticfiles_storage, 'is_immutable', None)
+    if is_immutable and is_immutable(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        response['Expires'] = http_date(time.time() + IMMUTABLE_MAX_AGE)
+    return response
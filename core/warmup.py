@@ -0,0 +1,78 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from django.template import TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.utils import get_app_template_dirs
+from django.urls import RegexURLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_urls():
+    # Compile every URL pattern and build the reverse lookup tables, which
+    # Django otherwise does on the first request. Returns the view count.
+    resolver = get_resolver()
+    resolver.reverse_dict
+    return walk_urls(resolver.url_patterns)
+
+
+def walk_urls(patterns):
+    count = 0
+    for pattern in patterns:
+        pattern.regex
+        if isinstance(pattern, RegexURLResolver):
+            pattern.reverse_dict
+            count += walk_urls(pattern.url_patterns)
+        else:
+            pattern.lookup_str
+            count += 1
+    return count
+
+
+def template_names(directory):
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            yield os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/')
+
+
+def compile_templates():
+    # Load every template the Django engines can find. With DEBUG off the
+    # engines use the cached loader, which keeps each one compiled for the
+    # life of the process. Returns the number compiled.
+    count = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        dirs = list(engine.engine.dirs)
+        if engine.engine.app_dirs:
+            dirs.extend(get_app_template_dirs('templates'))
+        names = sorted({name for directory in dirs for name in template_names(directory)})
+        for name in names:
+            try:
+                engine.get_template(name)
+            except TemplateSyntaxError as e:
+                # Usually a template for an app that isn't installed
+                logger.debug('Skipped template %s: %s', name, e)
+            else:
+                count += 1
+    return count
+
+
+def warm_up():
+    # Do the work Django leaves for the first requests up front. Returns
+    # the seconds each step took.
+    timings = OrderedDict()
+    start = time.perf_counter()
+    views = resolve_urls()
+    timings['urls'] = time.perf_counter() - start
+    start = time.perf_counter()
+    templates = compile_templates()
+    timings['templates'] = time.perf_counter() - start
+    logger.info(
+        'Warmed up %d views in %.3fs and %d templates in %.3fs',
+        views, timings['urls'], templates, timings['templates'],
+    )
+    return timings
@@ -1,9 +1,63 @@
-from django.contrib import admin
+from contextlib import contextmanager
 
-from .models import House, Bill, Roommate, Payment, PaymentEvent
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS, router
 
-admin.site.register(House)
-admin.site.register(Bill)
-admin.site.register(Roommate)
-admin.site.register(Payment)
-admin.site.register(PaymentEvent)
+from .models import House, Bill, Roommate, Payment, PaymentEvent, RecurringBill, RoommateBalance
+from .sharding import SHARDED_MODELS, house_id_of, lock_houses
+
+
+@contextmanager
+def house_lock(obj):
+    # Hold the directory row of obj's house, as HouseShardMixin does for
+    # writes through the views
+    if isinstance(obj, House):
+        if obj.id is None:
+            yield
+            return
+        house_id, shard = obj.id, House.objects.shard_for(obj.id)
+    else:
+        house_id, shard = house_id_of(obj), obj._state.db or router.db_for_write(type(obj), instance=obj)
+    with lock_houses([house_id], shard) as house_ids:
+        if house_id not in house_ids:
+            raise PermissionDenied('This house is being moved, please try again shortly.')
+        yield
+
+
+class HouseShardAdmin(admin.ModelAdmin):
+    # The admin only sees the default database: houses moved to a shard are
+    # listed, but their roommates, bills and payments are not. Saves and
+    # deletes are refused while the house is being moved. With shards the
+    # bulk delete action would bypass that, so it is left out.
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(DEFAULT_DB_ALIAS)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if settings.DATABASE_SHARDS:
+            actions.pop('delete_selected', None)
+        return actions
+
+    def changelist_view(self, request, extra_context=None):
+        if settings.DATABASE_SHARDS and self.model in SHARDED_MODELS:
+            messages.warning(request, 'Only rows on the default shard are listed here.')
+        return super().changelist_view(request, extra_context)
+
+    def save_model(self, request, obj, form, change):
+        with house_lock(obj):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with house_lock(obj):
+            super().delete_model(request, obj)
+
+
+admin.site.register(House, HouseShardAdmin)
+admin.site.register(Bill, HouseShardAdmin)
+admin.site.register(Roommate, HouseShardAdmin)
+admin.site.register(Payment, HouseShardAdmin)
+admin.site.register(PaymentEvent, HouseShardAdmin)
+admin.site.register(RoommateBalance, HouseShardAdmin)
+admin.site.register(RecurringBill, HouseShardAdmin)
@@ -0,0 +1,217 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import JsonResponse
+from django.views.generic import View
+
+from .models import House, Bill, Payment
+from .sharding import houses_by_shard, use_shard
+
+
+def serialize_house(house):
+    return {
+        'id': house.id,
+        'name': house.name,
+        'creator_id': house.creator_id,
+        'created': house.created,
+        'modified': house.modified,
+    }
+
+
+def serialize_roommate(roommate):
+    return {
+        'id': roommate.id,
+        'name': roommate.name,
+        'house_id': roommate.house_id,
+    }
+
+
+def serialize_bill(bill):
+    return {
+        'id': bill.id,
+        'name': bill.name,
+        'amount': bill.amount,
+        'amount_paid': bill.amount_paid,
+        'amount_due': bill.amount_due,
+        'owner_id': bill.owner_id,
+        'house_id': bill.house_id,
+        'due_date': bill.due_date,
+        'created': bill.created,
+        'modified': bill.modified,
+    }
+
+
+def serialize_payment(payment):
+    return {
+        'id': payment.id,
+        'bill_id': payment.bill_id,
+        'payer_id': payment.payer_id,
+        'amount': payment.amount,
+        'amount_paid': payment.amount_paid,
+        'amount_due': payment.amount_due,
+        'is_paid': payment.is_paid,
+    }
+
+
+def serialize_balance(balance):
+    return {
+        'id': balance.id,
+        'house_id': balance.house_id,
+        'debtor_id': balance.debtor_id,
+        'creditor_id': balance.creditor_id,
+        'amount': balance.amount,
+    }
+
+
+SERIALIZERS = {
+    'house': serialize_house,
+    'roommate': serialize_roommate,
+    'bill': serialize_bill,
+    'payment': serialize_payment,
+    'balance': serialize_balance,
+}
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class JSONAPIMixin(LoginRequiredMixin):
+    # Responses look like {"data": ..., "included": {"bills": [...], ...}}.
+    # ?fields=a,b trims the primary resource and ?fields[type]=a,b any
+    # resource type. ?include=x,y adds the related resources in includes.
+    raise_exception = True
+    resource_type = None
+    includes = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except APIError as e:
+            return JsonResponse({'errors': [{'detail': str(e)}]}, status=e.status)
+
+    def get_includes(self):
+        includes = [include for include in self.request.GET.get('include', '').split(',') if include]
+        unknown = set(includes) - set(self.includes)
+        if unknown:
+            raise APIError('Unknown include: {}'.format(', '.join(sorted(unknown))))
+        return includes
+
+    def get_fields(self, resource_type):
+        fields = self.request.GET.get('fields[{}]'.format(resource_type))
+        if fields is None and resource_type == self.resource_type:
+            fields = self.request.GET.get('fields')
+        return set(fields.split(',')) | {'id'} if fields else None
+
+    def serialize(self, obj, resource_type):
+        data = SERIALIZERS[resource_type](obj)
+        fields = self.get_fields(resource_type)
+        if fields is not None:
+            data = {key: value for key, value in data.items() if key in fields}
+        return data
+
+    def render(self, data, included):
+        document = {'data': data}
+        if included:
+            document['included'] = included
+        return JsonResponse(document)
+
+
+class HouseAPIMixin(JSONAPIMixin):
+    resource_type = 'house'
+    includes = ('bills', 'roommates', 'balances', 'payments')
+
+    def get_queryset(self):
+        return House.objects.filter(creator=self.request.user).order_by('id')
+
+    def get_prefetches(self, includes):
+        prefetches = []
+        if 'bills' in includes or 'payments' in includes:
+            prefetches.append(Prefetch('bill_set', queryset=Bill.objects.with_totals().order_by('id')))
+        if 'payments' in includes:
+            prefetches.append(Prefetch('bill_set__payment_set', queryset=Payment.objects.order_by('id')))
+        if 'roommates' in includes:
+            prefetches.append('roommate_set')
+        if 'balances' in includes:
+            prefetches.append('roommatebalance_set')
+        return prefetches
+
+    def prefetch(self, houses, includes):
+        # A prefetch reads from one database, so run one per shard
+        for shard_houses in houses_by_shard(houses).values():
+            prefetch_related_objects(shard_houses, *self.get_prefetches(includes))
+        return houses
+
+    def get_included(self, houses, includes):
+        included = {include: [] for include in includes}
+        for house in houses:
+            if 'bills' in includes:
+                included['bills'].extend(self.serialize(bill, 'bill') for bill in house.bill_set.all())
+            if 'payments' in includes:
+                included['payments'].extend(
+                    self.serialize(payment, 'payment')
+                    for bill in house.bill_set.all()
+                    for payment in bill.payment_set.all()
+                )
+            if 'roommates' in includes:
+                included['roommates'].extend(
+                    self.serialize(roommate, 'roommate') for roommate in house.roommate_set.all()
+                )
+            if 'balances' in includes:
+                included['balances'].extend(
+                    self.serialize(balance, 'balance') for balance in house.roommatebalance_set.all()
+                )
+        return included
+
+
+class HouseListAPIView(HouseAPIMixin, View):
+    def get(self, request, *args, **kwargs):
+        includes = self.get_includes()
+        houses = self.get_queryset()
+        ids = request.GET.get('ids')
+        if ids:
+            try:
+                houses = houses.filter(id__in=[int(house_id) for house_id in ids.split(',')])
+            except ValueError:
+                raise APIError('ids must be a comma separated list of integers')
+        houses = self.prefetch(list(houses), includes)
+        return self.render(
+            [self.serialize(house, 'house') for house in houses],
+            self.get_included(houses, includes),
+        )
+
+
+class HouseDetailAPIView(HouseAPIMixin, View):
+    def get(self, request, *args, **kwargs):
+        includes = self.get_includes()
+        house = self.get_queryset().filter(id=kwargs['pk']).first()
+        if house is None:
+            raise APIError('Not found', status=404)
+        self.prefetch([house], includes)
+        return self.render(self.serialize(house, 'house'), self.get_included([house], includes))
+
+
+class BillDetailAPIView(JSONAPIMixin, View):
+    resource_type = 'bill'
+    includes = ('payments',)
+
+    def get(self, request, *args, **kwargs):
+        includes = self.get_includes()
+        bill = None
+        houses = House.objects.filter(creator=request.user).only('id', 'shard')
+        # Ids are unique across shards, so at most one shard has the bill
+        for shard, shard_houses in houses_by_shard(houses).items():
+            with use_shard(shard):
+                bills = Bill.objects.with_totals().filter(house_id__in=[house.id for house in shard_houses], id=kwargs['pk'])
+                if 'payments' in includes:
+                    bills = bills.prefetch_related(Prefetch('payment_set', queryset=Payment.objects.order_by('id')))
+                bill = bills.first()
+            if bill is not None:
+                break
+        if bill is None:
+            raise APIError('Not found', status=404)
+        included = {}
+        if 'payments' in includes:
+            included['payments'] = [self.serialize(payment, 'payment') for payment in bill.payment_set.all()]
+        return self.render(self.serialize(bill, 'bill'), included)
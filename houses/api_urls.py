@@ -0,0 +1,9 @@
+from django.conf.urls import url
+
+from . import api
+
+urlpatterns = [
+    url(r'^houses$', api.HouseListAPIView.as_view(), name='api_house_list'),
+    url(r'^houses/(?P<pk>[0-9]+)$', api.HouseDetailAPIView.as_view(), name='api_house_detail'),
+    url(r'^bills/(?P<pk>[0-9]+)$', api.BillDetailAPIView.as_view(), name='api_bill_detail'),
+]
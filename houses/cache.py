@@ -0,0 +1,32 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def house_version_key(house_id):
+    return 'house:{}:version'.format(house_id)
+
+
+def get_house_version(house_id):
+    # Versions are random tokens rather than counters, so a version key that
+    # was evicted can never come back with a value used before
+    key = house_version_key(house_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def set_new_versions(house_ids):
+    cache.set_many({house_version_key(house_id): uuid.uuid4().hex for house_id in house_ids}, None)
+
+
+def bump_house_versions(house_ids):
+    # Bump now and again once the transaction commits, so a fragment
+    # rendered from uncommitted data in between is never served afterwards
+    house_ids = set(house_ids) - {None}
+    if house_ids:
+        set_new_versions(house_ids)
+        transaction.on_commit(lambda: set_new_versions(house_ids))
@@ -0,0 +1,55 @@
+import csv
+
+from django.db import router
+from django.db.models import Q
+
+from .models import Bill, Payment, PaymentEvent
+
+LEDGER_HEADER = [
+    'type', 'id', 'created', 'bill_id', 'bill', 'payment_id', 'payer', 'payee', 'amount', 'amount_paid',
+]
+
+
+class Echo:
+    # File-like object for csv.writer that hands each row back instead of
+    # buffering it
+    def write(self, value):
+        return value
+
+
+def ledger_rows(house=None, roommate=None):
+    # Every bill, split payment and payment event of a house, or the ones a
+    # roommate owns, owes or is owed. Rows are read with values_list() and
+    # iterator(), so memory use does not depend on the size of the ledger.
+    # Responses stream after the view returns, so the database is chosen
+    # here rather than left to the request's shard.
+    using = router.db_for_read(Bill, instance=roommate or house)
+    if roommate is not None:
+        bills = Bill.objects.using(using).filter(owner=roommate)
+        payments = Payment.objects.using(using).filter(Q(payer=roommate) | Q(bill__owner=roommate))
+        events = PaymentEvent.objects.using(using).filter(Q(payment__payer=roommate) | Q(payment__bill__owner=roommate))
+    else:
+        bills = Bill.objects.using(using).filter(house=house)
+        payments = Payment.objects.using(using).filter(bill__house=house)
+        events = PaymentEvent.objects.using(using).filter(payment__bill__house=house)
+
+    yield LEDGER_HEADER
+    for bill_id, created, name, owner, amount in bills.order_by('id').values_list(
+        'id', 'created', 'name', 'owner__name', 'amount',
+    ).iterator():
+        yield ['bill', bill_id, created, bill_id, name, '', '', owner, amount, '']
+    for payment_id, created, bill_id, bill, payer, payee, amount, amount_paid in payments.order_by('id').values_list(
+        'id', 'created', 'bill_id', 'bill__name', 'payer__name', 'bill__owner__name', 'amount', 'amount_paid',
+    ).iterator():
+        yield ['payment', payment_id, created, bill_id, bill, payment_id, payer, payee, amount, amount_paid]
+    for event_id, created, bill_id, bill, payment_id, payer, payee, amount in events.order_by('id').values_list(
+        'id', 'created', 'payment__bill_id', 'payment__bill__name', 'payment_id',
+        'payment__payer__name', 'payment__bill__owner__name', 'amount',
+    ).iterator():
+        yield ['payment_event', event_id, created, bill_id, bill, payment_id, payer, payee, amount, '']
+
+
+def ledger_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
@@ -1,15 +1,38 @@
+import codecs
+
 from django import forms
-from .models import PaymentEvent, Payment
+from .models import PaymentEvent
 
 
 class PaymentEventForm(forms.ModelForm):
     class Meta:
         model = PaymentEvent
-        fields = ['amount', 'payment']
+        fields = ['amount']
+
+    def __init__(self, *args, payment, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instance.payment = payment
 
     def clean_amount(self):
         data = self.cleaned_data['amount']
-        payment = Payment.objects.get(id=self.data['payment'])
-        if data > payment.amount:
+        if data > self.instance.payment.amount:
             raise forms.ValidationError('Amount is greater than total payment.')
         return data
+
+
+class LedgerImportForm(forms.Form):
+    file = forms.FileField()
+
+    def clean_file(self):
+        # The import decodes the file as it goes and commits chunk by chunk,
+        # so check the whole file decodes before any of it is imported
+        data = self.cleaned_data['file']
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        try:
+            for chunk in data.chunks():
+                decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            raise forms.ValidationError('File is not UTF-8 encoded. Save it as CSV UTF-8 and try again.')
+        data.seek(0)
+        return data
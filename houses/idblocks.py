@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import connections, transaction
+
+
+def id_range(alias):
+    # Each shard hands out ids from its own block, so ids are unique across
+    # shards and rows keep theirs when their house moves
+    index = settings.DATABASE_SHARDS.index(alias) + 1 if alias in settings.DATABASE_SHARDS else 0
+    return index * settings.SHARD_ID_SPAN, (index + 1) * settings.SHARD_ID_SPAN
+
+
+def highest_id(connection, cursor, table, start, end):
+    cursor.execute(
+        'SELECT MAX(id) FROM {} WHERE id >= %s AND id < %s'.format(connection.ops.quote_name(table)),
+        [start, end],
+    )
+    return cursor.fetchone()[0] or start
+
+
+def sqlite_sequence_top(connection, cursor, table, start, end):
+    # The last id handed out in [start, end): the table's sequence while it
+    # is in the block, else the highest row there
+    cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+    row = cursor.fetchone()
+    current = row[0] if row and start <= row[0] < end else start
+    return max(current, highest_id(connection, cursor, table, start, end))
+
+
+def set_sqlite_sequence(cursor, table, seq):
+    cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s', [table])
+    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, seq])
+
+
+def assign_ids(model, objs, using):
+    # SQLite gives a new row one more than the highest id in its table,
+    # whichever block that is in, so once a house moves in from a later
+    # shard no sequence can keep new rows in this database's block. With
+    # shards, take the ids from the block instead.
+    if not settings.DATABASE_SHARDS or connections[using].vendor != 'sqlite':
+        return
+    objs = [obj for obj in objs if obj.pk is None]
+    if not objs:
+        return
+    start, end = id_range(using)
+    connection = connections[using]
+    table = model._meta.db_table
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        top = sqlite_sequence_top(connection, cursor, table, start, end)
+        if top + len(objs) >= end:
+            raise ValueError('{} has run out of ids on {}'.format(table, using))
+        set_sqlite_sequence(cursor, table, top + len(objs))
+    for offset, obj in enumerate(objs, 1):
+        obj.pk = top + offset
@@ -0,0 +1,199 @@
+import csv
+from collections import defaultdict, namedtuple
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, models, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.bulk import bulk_insert, chunked
+
+from .cache import bump_house_versions
+from .models import Bill, Payment, PaymentEvent, RoommateBalance
+
+IMPORT_CHUNK_SIZE = 500
+
+ChunkReport = namedtuple('ChunkReport', ['number', 'rows', 'bills', 'payments', 'events', 'errors'])
+
+
+class RowError(Exception):
+    pass
+
+
+class LedgerImporter:
+    # Imports rows in the format written by houses.exports into one house.
+    # The id, bill_id and payment_id columns are the source system's ids and
+    # are only used to link payments to bills and events to payments, so
+    # payments may refer to bills from earlier chunks. A payment's
+    # amount_paid column is its running total; events are kept as history.
+    def __init__(self, house, chunk_size=IMPORT_CHUNK_SIZE):
+        self.house = house
+        self.chunk_size = chunk_size
+        self.roommates = {}
+        for roommate_id, name in house.roommate_set.values_list('id', 'name'):
+            # Names that appear twice can't be told apart
+            self.roommates[name] = None if name in self.roommates else roommate_id
+        # Source id to new id, for this and earlier chunks. Bills map to
+        # (id, owner_id) so payments can be posted to the ledger.
+        self.bills, self.chunk_bills = {}, {}
+        self.payments, self.chunk_payments = {}, {}
+
+    def run(self, lines):
+        # lines is any iterable of text lines, so files and uploads are
+        # parsed as they are read. Yields a ChunkReport per chunk.
+        rows = enumerate(csv.DictReader(lines), start=2)
+        for number, chunk in enumerate(chunked(rows, self.chunk_size), start=1):
+            yield self.import_chunk(number, chunk)
+
+    def import_chunk(self, number, chunk):
+        errors = []
+        bills, payments, events = [], [], []
+        by_type = {'bill': bills, 'payment': payments, 'payment_event': events}
+        for line, row in chunk:
+            if row.get('type') in by_type:
+                by_type[row['type']].append((line, row))
+            else:
+                errors.append((line, 'Unknown row type {!r}'.format(row.get('type'))))
+
+        new_bills, new_payments = {}, {}
+        try:
+            with transaction.atomic(using=router.db_for_write(Bill, instance=self.house)):
+                bill_keys, bill_objs = self.build(bills, self.build_bill, errors)
+                bulk_insert(Bill, bill_objs)
+                new_bills = {key: (bill.id, bill.owner_id) for key, bill in zip(bill_keys, bill_objs)}
+
+                self.chunk_bills = new_bills
+                payment_keys, payment_objs = self.build(payments, self.build_payment, errors)
+                bulk_insert(Payment, payment_objs)
+                new_payments = {key: payment.id for key, payment in zip(payment_keys, payment_objs)}
+
+                self.chunk_payments = new_payments
+                event_keys, event_objs = self.build(events, self.build_event, errors)
+                bulk_insert(PaymentEvent, event_objs)
+
+                for model, objs in ((Bill, bill_objs), (Payment, payment_objs), (PaymentEvent, event_objs)):
+                    restore_created(model, [obj for obj in objs if obj.imported_created])
+                RoommateBalance.objects.apply_deltas(self.payment_deltas(payment_objs))
+                bump_house_versions([self.house.id])
+        except DatabaseError as e:
+            errors.append((chunk[0][0], 'Chunk not imported: {}'.format(e)))
+            return ChunkReport(number, len(chunk), 0, 0, 0, errors)
+        finally:
+            self.chunk_bills = self.chunk_payments = {}
+
+        self.bills.update(new_bills)
+        self.payments.update(new_payments)
+        return ChunkReport(number, len(chunk), len(bill_objs), len(payment_objs), len(event_objs), errors)
+
+    def build(self, rows, build_row, errors):
+        keys, objs = [], []
+        for line, row in rows:
+            try:
+                key, obj = build_row(row)
+            except RowError as e:
+                errors.append((line, str(e)))
+            except ValidationError as e:
+                errors.append((line, '; '.join(e.messages)))
+            else:
+                keys.append(key)
+                objs.append(obj)
+        return keys, objs
+
+    def build_bill(self, row):
+        key = self.source_id(row, 'id')
+        if key in self.bills or key in self.chunk_bills:
+            raise RowError('Duplicate bill {}'.format(key))
+        bill = Bill(
+            house_id=self.house.id,
+            name=clean(Bill, 'name', row.get('bill')),
+            owner_id=self.roommate(row.get('payee')),
+            amount=clean(Bill, 'amount', row.get('amount')),
+        )
+        bill.imported_created = parse_created(row.get('created'))
+        return key, bill
+
+    def build_payment(self, row):
+        key = self.source_id(row, 'id')
+        if key in self.payments or key in self.chunk_payments:
+            raise RowError('Duplicate payment {}'.format(key))
+        bill_key = self.source_id(row, 'bill_id')
+        bill = self.bills.get(bill_key) or self.chunk_bills.get(bill_key)
+        if bill is None:
+            raise RowError('Unknown bill {}'.format(bill_key))
+        amount = clean(Payment, 'amount', row.get('amount'))
+        amount_paid = clean(Payment, 'amount_paid', row.get('amount_paid') or '0.00')
+        if amount_paid > amount:
+            raise RowError('Amount paid is greater than total payment.')
+        payment = Payment(
+            bill_id=bill[0],
+            payer_id=self.roommate(row.get('payer')),
+            amount=amount,
+            amount_paid=amount_paid,
+        )
+        payment.owner_id = bill[1]
+        payment.imported_created = parse_created(row.get('created'))
+        return key, payment
+
+    def build_event(self, row):
+        payment_key = self.source_id(row, 'payment_id')
+        payment_id = self.payments.get(payment_key) or self.chunk_payments.get(payment_key)
+        if payment_id is None:
+            raise RowError('Unknown payment {}'.format(payment_key))
+        event = PaymentEvent(payment_id=payment_id, amount=clean(PaymentEvent, 'amount', row.get('amount')))
+        event.imported_created = parse_created(row.get('created'))
+        return None, event
+
+    def source_id(self, row, column):
+        value = (row.get(column) or '').strip()
+        if not value:
+            raise RowError('Missing {}'.format(column))
+        return value
+
+    def roommate(self, name):
+        name = (name or '').strip()
+        if name not in self.roommates:
+            raise RowError('Unknown roommate {!r}'.format(name))
+        if self.roommates[name] is None:
+            raise RowError('More than one roommate is named {!r}'.format(name))
+        return self.roommates[name]
+
+    def payment_deltas(self, payments):
+        deltas = defaultdict(Decimal)
+        for payment in payments:
+            deltas[(payment.payer_id, payment.owner_id)] += payment.amount - payment.amount_paid
+        return deltas
+
+
+def clean(model, field_name, value):
+    return model._meta.get_field(field_name).clean((value or '').strip(), None)
+
+
+def parse_created(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        created = parse_datetime(value)
+        if created is None:
+            date = parse_date(value)
+            created = date and datetime.combine(date, time())
+    except ValueError:
+        created = None
+    if created is None:
+        raise RowError('Invalid date {!r}'.format(value))
+    if timezone.is_naive(created):
+        created = timezone.make_aware(created)
+    return created
+
+
+def restore_created(model, objs, batch_size=250):
+    # bulk_create stamps auto_now_add fields with the current time, so put
+    # the source dates back with one UPDATE per batch
+    for i in range(0, len(objs), batch_size):
+        batch = objs[i:i + batch_size]
+        model.objects.filter(id__in=[obj.id for obj in batch]).update(created=models.Case(
+            *[models.When(id=obj.id, then=models.Value(obj.imported_created)) for obj in batch],
+            output_field=model._meta.get_field('created')
+        ))
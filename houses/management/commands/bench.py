@@ -0,0 +1,68 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.runner import DiscoverRunner
+
+from benchmarks.views import time_connection_reuse, time_views
+from core.factories import seed_house
+
+
+class Command(BaseCommand):
+    help = 'Seed throwaway houses at several scales and time every house view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roommates', nargs='+', type=int, default=[10, 100])
+        parser.add_argument('--bills', type=int, default=10000)
+        parser.add_argument('--events', type=int, default=10000)
+        parser.add_argument(
+            '--split-size',
+            type=int,
+            default=10,
+            help='Roommates sharing each bill, 0 for the whole house',
+        )
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument(
+            '--conn-max-age',
+            nargs='+',
+            type=int,
+            default=[0, 600],
+            help='CONN_MAX_AGE values to compare connection reuse under',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        # Everything runs in a test database that is destroyed afterwards
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            report = {'runs': []}
+            for roommates in options['roommates']:
+                start = time.perf_counter()
+                house = seed_house(
+                    roommates,
+                    options['bills'],
+                    options['events'],
+                    split_size=options['split_size'],
+                    batch_size=options['batch_size'],
+                )
+                seed_seconds = time.perf_counter() - start
+                self.stderr.write('Seeded {} roommates in {:.1f}s'.format(roommates, seed_seconds))
+                report['runs'].append({
+                    'roommates': roommates,
+                    'bills': options['bills'],
+                    'events': options['events'],
+                    'seed_seconds': round(seed_seconds, 3),
+                    'views': time_views(house, options['iterations']),
+                    'connections': time_connection_reuse(house, options['conn_max_age'], options['iterations']),
+                })
+        finally:
+            runner.teardown_databases(old_config)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.db.models import Max
+
+from benchmarks.plans import explain_hotpaths
+from houses.models import House, Bill
+from houses.sharding import shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot ORM querysets against the current database and flag sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--house', type=int, help='House to build the querysets for, defaults to the newest with bills')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--check', action='store_true', help='Fail if any queryset scans a whole table')
+        parser.add_argument(
+            '--ignore-table',
+            action='append',
+            default=[],
+            help='Table whose sequential scans are expected, e.g. a small lookup table',
+        )
+
+    def handle(self, *args, **options):
+        if options['house']:
+            house_id = options['house']
+        else:
+            # Bills live on the shards, so ask each one for its newest house
+            house_ids = [Bill.objects.using(alias).aggregate(Max('house_id'))['house_id__max'] for alias in shard_aliases()]
+            house_id = max(filter(None, house_ids), default=None)
+        house = House.objects.filter(id=house_id).first()
+        if house is None:
+            raise CommandError('No house to explain, pass --house or seed the database first')
+
+        with use_shard(house.shard):
+            queries = explain_hotpaths(house)
+        flagged = {
+            name: [scan['table'] for scan in result['seq_scans'] if scan['table'] not in options['ignore_table']]
+            for name, result in queries.items()
+        }
+        flagged = {name: tables for name, tables in flagged.items() if tables}
+        report = {
+            'vendor': connections[router.db_for_read(Bill, instance=house)].vendor,
+            'house_id': house.id,
+            'queries': queries,
+            'flagged': flagged,
+        }
+
+        output = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        for name, tables in sorted(flagged.items()):
+            self.stderr.write('{}: sequential scan on {}'.format(name, ', '.join(tables)))
+        if options['check'] and flagged:
+            raise CommandError('{} querysets scan whole tables'.format(len(flagged)))
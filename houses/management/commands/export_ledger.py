@@ -0,0 +1,42 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from houses.exports import ledger_rows
+from houses.models import House, Roommate
+from houses.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Write every bill, payment and payment event of a house or roommate as CSV'
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--house', type=int)
+        group.add_argument('--roommate', type=int)
+        parser.add_argument('--output', help='File to write, defaults to stdout')
+
+    def handle(self, *args, **options):
+        if not options['house'] and not options['roommate']:
+            raise CommandError('One of --house or --roommate is required')
+        try:
+            if options['house']:
+                rows = ledger_rows(house=House.objects.get(id=options['house']))
+            else:
+                rows = ledger_rows(roommate=self.get_roommate(options['roommate']))
+        except (House.DoesNotExist, Roommate.DoesNotExist) as e:
+            raise CommandError(e)
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                csv.writer(f).writerows(rows)
+        else:
+            csv.writer(self.stdout).writerows(rows)
+
+    def get_roommate(self, roommate_id):
+        # Ids are unique across shards, so the first match is the roommate
+        for alias in shard_aliases():
+            roommate = Roommate.objects.using(alias).filter(id=roommate_id).first()
+            if roommate is not None:
+                return roommate
+        raise Roommate.DoesNotExist('Roommate matching query does not exist.')
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from django.utils import timezone
+
+from houses.models import RecurringBill, Bill
+from houses.sharding import lock_houses, shard_aliases, use_shard
+
+
+class Command(BaseCommand):
+    help = "Create the period's bills and split payments from every active recurring bill"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', help='Month to bill as YYYY-MM, defaults to the current month')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['period']:
+            try:
+                period = datetime.strptime(options['period'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('Period must look like YYYY-MM')
+        else:
+            period = timezone.localdate().replace(day=1)
+
+        # Templates are walked by id in batches, and only those without a
+        # bill for the period are picked up, so reruns create nothing twice
+        created = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                created += self.generate(alias, period, options['batch_size'])
+
+        self.stdout.write('Created {} bills for {:%Y-%m}'.format(created, period))
+
+    def generate(self, alias, period, batch_size):
+        created = 0
+        last_id = 0
+        while True:
+            templates = RecurringBill.objects.due(period).filter(id__gt=last_id).order_by('id')[:batch_size]
+            if not templates:
+                break
+            last_id = list(templates)[-1].id
+            with lock_houses({template.house_id for template in templates}, alias) as house_ids:
+                moving = [template.id for template in templates if template.house_id not in house_ids]
+                if moving:
+                    # Their next run picks them up
+                    self.stderr.write('Skipped recurring bills {}: house being moved'.format(
+                        ', '.join(str(template_id) for template_id in moving),
+                    ))
+                    templates = RecurringBill.objects.filter(
+                        id__in=[template.id for template in templates if template.house_id in house_ids],
+                    ).order_by('id')
+                created += self.generate_batch(templates, period)
+        return created
+
+    def generate_batch(self, templates, period):
+        try:
+            return len(templates.create_bills(period))
+        except IntegrityError:
+            # Another run created some of this batch in the meantime, or
+            # one template's bill can't be inserted. Go one at a time so
+            # only those are skipped.
+            return sum(self.generate_one(template, period) for template in templates)
+
+    def generate_one(self, template, period):
+        try:
+            return len(RecurringBill.objects.filter(id=template.id).create_bills(period))
+        except IntegrityError as e:
+            if Bill.objects.filter(recurring_bill_id=template.id, period=period).exists():
+                self.stderr.write('Skipped recurring bill {}: already generated'.format(template.id))
+            else:
+                self.stderr.write('Skipped recurring bill {}: {}'.format(template.id, e))
+            return 0
@@ -0,0 +1,49 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from houses.imports import IMPORT_CHUNK_SIZE, LedgerImporter
+from houses.models import House
+from houses.sharding import lock_houses, use_shard
+
+
+class Command(BaseCommand):
+    help = 'Import bills, payments and payment events from a ledger CSV into a house'
+
+    def add_arguments(self, parser):
+        parser.add_argument('house_id', type=int)
+        parser.add_argument('path', help='CSV file to read, or - for stdin')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            house = House.objects.get(id=options['house_id'])
+        except House.DoesNotExist as e:
+            raise CommandError(e)
+
+        # Held for the whole import, so the house can't be moved under it
+        with use_shard(house.shard), lock_houses([house.id], house.shard) as house_ids:
+            if not house_ids:
+                raise CommandError('House {} is being moved, try again once it is done'.format(house.id))
+            importer = LedgerImporter(house, chunk_size=options['chunk_size'])
+            try:
+                if options['path'] == '-':
+                    failed = self.report(importer.run(sys.stdin))
+                else:
+                    with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                        failed = self.report(importer.run(f))
+            except UnicodeDecodeError as e:
+                raise CommandError('The file is not UTF-8 encoded: {}'.format(e))
+        if failed:
+            raise CommandError('Import finished with {} errors'.format(failed))
+
+    def report(self, reports):
+        failed = 0
+        for report in reports:
+            self.stdout.write('Chunk {}: {} rows, {} bills, {} payments, {} payment events'.format(
+                report.number, report.rows, report.bills, report.payments, report.events,
+            ))
+            for line, message in report.errors:
+                self.stdout.write('  line {}: {}'.format(line, message))
+            failed += len(report.errors)
+        return failed
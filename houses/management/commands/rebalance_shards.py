@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from houses.models import House
+from houses.sharding import house_loads, move_house, plan_moves, shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Move houses between shards, one given house or as many as it takes to even the shards out'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--house', type=int, help='House to move, with --to')
+        parser.add_argument('--to', help='Shard to move the house to')
+        parser.add_argument('--dry-run', action='store_true', help='Print the moves without making them')
+
+    def handle(self, *args, **options):
+        if options['house'] or options['to']:
+            if not (options['house'] and options['to']):
+                raise CommandError('--house and --to go together')
+            if options['to'] not in shard_aliases():
+                raise CommandError('Unknown shard {}, choose from {}'.format(options['to'], ', '.join(shard_aliases())))
+            try:
+                house = House.objects.get(id=options['house'])
+            except House.DoesNotExist as e:
+                raise CommandError(e)
+            moves = [(house.id, house.shard, options['to'])]
+        else:
+            if len(settings.DATABASE_SHARDS) < 2:
+                raise CommandError('Rebalancing needs at least two shards in DB_SHARD_NAMES')
+            moves = plan_moves(house_loads(), settings.DATABASE_SHARDS)
+
+        for house_id, source, target in moves:
+            if options['dry_run']:
+                self.stdout.write('House {}: {} -> {}'.format(house_id, source, target))
+                continue
+            house = House.objects.get(id=house_id)
+            rows = move_house(house, target)
+            self.stdout.write('House {}: {} -> {}, {} rows'.format(house_id, source, target, rows))
+        if not moves:
+            self.stdout.write('Shards are balanced')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from houses.models import House, RoommateBalance
+from houses.sharding import use_shard
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the roommate balance ledger from payments, or check it for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('house_ids', nargs='*', type=int)
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Report drift between the ledger and payments without writing',
+        )
+
+    def handle(self, *args, **options):
+        houses = House.objects.order_by('id')
+        if options['house_ids']:
+            houses = houses.filter(id__in=options['house_ids'])
+
+        drifted = 0
+        for house in houses.iterator():
+            if options['check']:
+                with use_shard(house.shard):
+                    drift = self.get_drift(house)
+                for (debtor_id, creditor_id), (stored, expected) in sorted(drift.items()):
+                    self.stdout.write(
+                        'House {}: roommate {} owes roommate {} {} but ledger has {}'.format(
+                            house.id, debtor_id, creditor_id, expected, stored,
+                        )
+                    )
+                drifted += bool(drift)
+            else:
+                rows = RoommateBalance.objects.rebuild(house)
+                self.stdout.write('House {}: {} balances'.format(house.id, len(rows)))
+
+        if drifted:
+            raise CommandError('{} houses have drifted'.format(drifted))
+
+    def get_drift(self, house):
+        expected = house.balance_matrix()
+        stored = {
+            (debtor_id, creditor_id): amount
+            for debtor_id, creditor_id, amount in RoommateBalance.objects.filter(
+                house=house,
+            ).values_list('debtor_id', 'creditor_id', 'amount')
+        }
+        drift = {}
+        for pair in set(expected) | set(stored):
+            if stored.get(pair, 0) != expected.get(pair, 0):
+                drift[pair] = (stored.get(pair, 0), expected.get(pair, 0))
+        return drift
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.factories import seed_house
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with fake houses, bills and payments using bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--houses', type=int, default=1)
+        parser.add_argument('--roommates', type=int, default=4, help='Roommates per house')
+        parser.add_argument('--bills', type=int, default=1000, help='Bills per house')
+        parser.add_argument('--events', type=int, default=1000, help='Payment events per house')
+        parser.add_argument(
+            '--split-size',
+            type=int,
+            default=0,
+            help='Roommates sharing each bill, 0 for the whole house',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, help='Random seed for repeatable data')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        for i in range(options['houses']):
+            house = seed_house(
+                options['roommates'],
+                options['bills'],
+                options['events'],
+                split_size=options['split_size'],
+                batch_size=options['batch_size'],
+                seed=None if options['seed'] is None else options['seed'] + i,
+            )
+            self.stdout.write('Seeded house {} ({:.1f}s)'.format(house.id, time.perf_counter() - start))
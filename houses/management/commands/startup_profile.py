@@ -0,0 +1,52 @@
+import json
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Import the WSGI app in a fresh interpreter and report the import time of every module'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='settings.wsgi', help='Module to import, defaults to the WSGI app')
+        parser.add_argument('--limit', type=int, default=30, help='Modules to list, 0 for all')
+        parser.add_argument(
+            '--sort',
+            choices=['self', 'cumulative'],
+            default='self',
+            help='Order by time spent in the module itself or including what it imports',
+        )
+        parser.add_argument('--output', help='Write every module as JSON to this file')
+
+    def handle(self, *args, **options):
+        # A fresh interpreter, since this one has already imported everything
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.startup', options['module']],
+            cwd=settings.BASE_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if result.returncode:
+            raise CommandError('Importing {} failed:\n{}'.format(options['module'], result.stderr))
+        timings = json.loads(result.stdout)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(
+                    [{'module': name, 'self': own, 'cumulative': cumulative} for name, own, cumulative in timings],
+                    f,
+                    indent=2,
+                )
+
+        total = sum(own for name, own, cumulative in timings)
+        column = 1 if options['sort'] == 'self' else 2
+        timings.sort(key=lambda row: row[column], reverse=True)
+        if options['limit']:
+            timings = timings[:options['limit']]
+        self.stdout.write('{:>10} {:>10}  module'.format('self ms', 'total ms'))
+        for name, own, cumulative in timings:
+            self.stdout.write('{:10.1f} {:10.1f}  {}'.format(own * 1000, cumulative * 1000, name))
+        self.stdout.write('Imported {} in {:.1f} ms'.format(options['module'], total * 1000))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 12:59
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0002_auto_20171107_0747'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoommateBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('creditor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credits', to='houses.Roommate')),
+                ('debtor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='debts', to='houses.Roommate')),
+                ('house', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='houses.House')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='roommatebalance',
+            unique_together=set([('debtor', 'creditor')]),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 13:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0003_roommatebalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringBill',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('day_of_month', models.PositiveSmallIntegerField(default=1)),
+                ('active', models.BooleanField(default=True)),
+                ('house', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='houses.House')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='houses.Roommate')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='period',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='recurring_bill',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bills', to='houses.RecurringBill'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bill',
+            unique_together=set([('recurring_bill', 'period')]),
+        ),
+    ]
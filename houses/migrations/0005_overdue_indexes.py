@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 13:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+# Django can't declare partial indexes yet, so create the unpaid payments
+# index by hand on the backends that support WHERE on CREATE INDEX
+PARTIAL_INDEX_VENDORS = ('postgresql', 'sqlite')
+
+
+def create_unpaid_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute(
+            'CREATE INDEX houses_payment_unpaid_idx ON houses_payment (bill_id) '
+            'WHERE amount_paid < amount'
+        )
+
+
+def drop_unpaid_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute('DROP INDEX houses_payment_unpaid_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0004_recurringbill'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['house', 'due_date'], name='houses_bill_house_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payer', 'bill'], name='houses_payment_payer_bill_idx'),
+        ),
+        migrations.RunPython(create_unpaid_index, drop_unpaid_index),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 13:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def keep_houses_on_default(apps, schema_editor):
+    # Existing houses stay where their data already is
+    House = apps.get_model('houses', 'House')
+    House.objects.using(schema_editor.connection.alias).filter(shard='').update(shard='default')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0005_overdue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='house',
+            name='moving_to',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='house',
+            name='shard',
+            field=models.CharField(db_index=True, default='', max_length=100),
+        ),
+        migrations.RunPython(keep_houses_on_default, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bill',
+            name='house',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='houses.House'),
+        ),
+        migrations.AlterField(
+            model_name='recurringbill',
+            name='house',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='houses.House'),
+        ),
+        migrations.AlterField(
+            model_name='roommate',
+            name='house',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='houses.House'),
+        ),
+        migrations.AlterField(
+            model_name='roommatebalance',
+            name='house',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='houses.House'),
+        ),
+    ]
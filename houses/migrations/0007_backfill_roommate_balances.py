@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 15:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def rebuild_balances(apps, schema_editor):
+    # Fill the ledger from the payments already on this database, like
+    # RoommateBalance.objects.rebuild() does for one house
+    Payment = apps.get_model('houses', 'Payment')
+    RoommateBalance = apps.get_model('houses', 'RoommateBalance')
+    using = schema_editor.connection.alias
+    rows = Payment.objects.using(using).exclude(
+        bill__owner_id=models.F('payer_id'),
+    ).values(
+        'payer_id', 'payer__house_id', 'bill__owner_id',
+    ).annotate(
+        amount_sum=models.Sum('amount'),
+        amount_paid_sum=models.Sum('amount_paid'),
+    ).order_by()
+    RoommateBalance.objects.using(using).all().delete()
+    RoommateBalance.objects.using(using).bulk_create([
+        RoommateBalance(
+            house_id=row['payer__house_id'],
+            debtor_id=row['payer_id'],
+            creditor_id=row['bill__owner_id'],
+            amount=row['amount_sum'] - row['amount_paid_sum'],
+        )
+        for row in rows.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0006_house_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 15:20
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_created(apps, schema_editor):
+    # Events recorded before created was added take their payment's date,
+    # or their bill's for payments that predate it too
+    Payment = apps.get_model('houses', 'Payment')
+    PaymentEvent = apps.get_model('houses', 'PaymentEvent')
+    using = schema_editor.connection.alias
+    payments = Payment.objects.using(using).filter(id=OuterRef('payment_id'))
+    PaymentEvent.objects.using(using).filter(created__isnull=True).update(created=Coalesce(
+        Subquery(payments.values('created')),
+        Subquery(payments.values('bill__created')),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0007_backfill_roommate_balances'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_created, migrations.RunPython.noop),
+    ]
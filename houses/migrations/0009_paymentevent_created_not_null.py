@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 15:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0008_backfill_paymentevent_created'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentevent',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.6 on 2026-10-18 15:41
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def clamp_day_of_month(apps, schema_editor):
+    # Bring days saved before the validators into 1-31
+    RecurringBill = apps.get_model('houses', 'RecurringBill')
+    templates = RecurringBill.objects.using(schema_editor.connection.alias)
+    templates.filter(day_of_month__lt=1).update(day_of_month=1)
+    templates.filter(day_of_month__gt=31).update(day_of_month=31)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('houses', '0009_paymentevent_created_not_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_day_of_month, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recurringbill',
+            name='day_of_month',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(31)]),
+        ),
+    ]
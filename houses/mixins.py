@@ -1,19 +1,93 @@
+from django.conf import settings
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import Http404, HttpResponse
+
+from core.routers import use_replicas
 
 from .models import House
+from .sharding import use_shard
+
+
+class ReplicaReadMixin:
+    # Serve GET and HEAD from a read replica. The response is rendered here
+    # so the template's queries use the replica too. Put this first so
+    # permission checks read from the replica as well.
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        # The session and user are loaded lazily; load them from the primary
+        # so a lagging replica can't log anyone out
+        request.user.is_authenticated
+        with use_replicas():
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
+class HouseShardMixin:
+    # Run the view against the shard holding its house's data, rendering
+    # inside so the template's queries go there too. Writes hold the house's
+    # directory row until they are done, so a move can't start copying the
+    # house under them, and get a 503 while it is being moved.
+    house_url_kwarg = 'house_id'
+
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.DATABASE_SHARDS:
+            return super().dispatch(request, *args, **kwargs)
+        houses = House.objects.using(DEFAULT_DB_ALIAS).filter(id=kwargs[self.house_url_kwarg])
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return self.dispatch_to_shard(houses, request, *args, **kwargs)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            return self.dispatch_to_shard(houses.select_for_update(), request, *args, **kwargs)
+
+    def dispatch_to_shard(self, houses, request, *args, **kwargs):
+        try:
+            shard, moving_to = houses.values_list('shard', 'moving_to').get()
+        except House.DoesNotExist:
+            raise Http404('No house matches the given query.')
+        if moving_to and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return HttpResponse('This house is being moved, please try again shortly.', status=503)
+        with use_shard(shard):
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
+class SingleObjectCacheMixin:
+    # Fetch the view's object once per request. Permission checks, the view
+    # itself and success URLs all share the same instance.
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
 
+class CreatorCheckMixin(SingleObjectCacheMixin, UserPassesTestMixin):
+    def get_queryset(self):
+        return super().get_queryset().filter(creator_id=self.request.user.id)
 
-class CreatorCheckMixin(UserPassesTestMixin):
     def test_func(self):
-        obj = self.get_object()
-        return obj.creator == self.request.user
+        if not self.request.user.is_authenticated:
+            return False
+        try:
+            self.get_object()
+        except Http404:
+            return False
+        return True
 
 
 class HouseChildrenMixin(UserPassesTestMixin):
     def get_house(self):
-        house_id = self.kwargs.get('house_id')
-        return House.objects.get(id=house_id)
+        # Views are instantiated per request, so this caches for the request
+        if not hasattr(self, '_house'):
+            house_id = self.kwargs.get('house_id')
+            self._house = House.objects.get(id=house_id)
+        return self._house
 
     def test_func(self):
-        house = self.get_house()
-        return self.request.user.is_authenticated and self.request.user.id == house.creator.id
+        return self.request.user.is_authenticated and self.request.user.id == self.get_house().creator_id
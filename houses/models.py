@@ -1,7 +1,36 @@
+import calendar
+from datetime import datetime, time
 from decimal import Decimal
 
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, models, router, transaction
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
+
+from core.bulk import bulk_insert
+
+from .cache import bump_house_versions
+from .idblocks import assign_ids
+from .splits import EqualSplit
+
+
+class HouseQuerySet(models.QuerySet):
+    # Houses always live on the default database, which makes the table the
+    # shard directory for everything that hangs off a house
+
+    def shard_for(self, house_id):
+        if not settings.DATABASE_SHARDS:
+            return DEFAULT_DB_ALIAS
+        return self.using(DEFAULT_DB_ALIAS).values_list('shard', flat=True).get(id=house_id)
+
+    def least_loaded_shard(self):
+        if not settings.DATABASE_SHARDS:
+            return DEFAULT_DB_ALIAS
+        counts = dict(self.using(DEFAULT_DB_ALIAS).filter(
+            shard__in=settings.DATABASE_SHARDS,
+        ).values_list('shard').annotate(models.Count('id')).order_by())
+        return min(settings.DATABASE_SHARDS, key=lambda alias: counts.get(alias, 0))
 
 
 class House(models.Model):
@@ -12,78 +41,217 @@ class House(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         null=True)
+    # Database alias holding the house's roommates, bills and payments.
+    # moving_to is set while rebalance_shards copies the house elsewhere.
+    shard = models.CharField(max_length=100, db_index=True, default='')
+    moving_to = models.CharField(max_length=100, blank=True, default='')
+
+    objects = HouseQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.shard:
+            self.shard = House.objects.least_loaded_shard()
+        super().save(*args, **kwargs)
+
+    def balance_matrix(self):
+        # Net amount owed for every (payer, owner) pair in the house
+        return {
+            (row['payer_id'], row['bill__owner_id']): row['amount_sum'] - row['amount_paid_sum']
+            for row in self.balance_rows()
+        }
+
+    def balance_rows(self):
+        return Payment.objects.using(router.db_for_read(Payment, instance=self)).filter(
+            payer__house=self,
+        ).exclude(
+            bill__owner_id=models.F('payer_id'),
+        ).values(
+            'payer_id', 'bill__owner_id',
+        ).annotate(
+            amount_sum=models.Sum('amount'),
+            amount_paid_sum=models.Sum('amount_paid'),
+        ).order_by()
+
+
+class ShardedQuerySet(models.QuerySet):
+    # For the models kept on a house's shard. bulk_create sends no pre_save,
+    # so ids are assigned here; see houses.idblocks.assign_ids.
+    def bulk_create(self, objs, batch_size=None):
+        objs = list(objs)
+        self._for_write = True
+        assign_ids(self.model, objs, self.db)
+        return super().bulk_create(objs, batch_size)
+
 
 class Roommate(models.Model):
     name = models.CharField(max_length=200)
-    house = models.ForeignKey(House, on_delete=models.CASCADE)
+    house = models.ForeignKey(House, on_delete=models.CASCADE, db_constraint=False)
+
+    objects = ShardedQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
-    def payment_history(self):
-        payments = self.payment_set
+    def payment_history(self, cursor=None):
+        # Newest first. cursor is a (created, id) pair from the last event of
+        # the previous page
         payment_events = PaymentEvent.objects.filter(
-            payment__in=payments.values_list('id', flat=True)
-        ).order_by('-created')
+            payment__payer=self,
+        ).select_related(
+            'payment__payer',
+            'payment__bill__owner',
+        ).order_by('-created', '-id')
+        if cursor is not None:
+            created, event_id = cursor
+            payment_events = payment_events.filter(
+                models.Q(created__lt=created) | models.Q(created=created, id__lt=event_id)
+            )
         return payment_events
 
-    def amounts_owed_from_roommates(self):
+    def amounts_owed_from_roommates(self, balances=None):
         # List of total amounts owed by each roommate to the current roomamte
+        if balances is None:
+            balances = self.house.balance_matrix()
         roommates = self.house.roommate_set.exclude(id=self.id)
         amounts = []
         for roommate in roommates:
-            data = {}
-            payments = roommate.payment_set.filter(
-                bill__owner_id=self.id,
-            )
-            if payments.count() > 0:
-                amount_paid_sum = payments.aggregate(
-                    models.Sum('amount_paid'))['amount_paid__sum']
-                amount_sum = payments.aggregate(
-                    models.Sum('amount'))['amount__sum']
-                data['amount'] = amount_sum - amount_paid_sum
-                data['roommate_name'] = roommate.name
-                amounts.append(data)
+            amount = balances.get((roommate.id, self.id))
+            if amount is not None:
+                amounts.append({
+                    'amount': amount,
+                    'roommate_name': roommate.name,
+                })
         return amounts
 
-    def amounts_owed_to_roommates(self):
+    def amounts_owed_to_roommates(self, balances=None):
+        if balances is None:
+            balances = self.house.balance_matrix()
         roommates = self.house.roommate_set.exclude(id=self.id)
         amounts = []
         for roommate in roommates:
-            data = {}
-            payments = self.payment_set.filter(
-                bill__owner_id=roommate.id
-            )
-            if payments.count() > 0:
-                amount_paid_sum = payments.aggregate(
-                    models.Sum('amount_paid'))['amount_paid__sum']
-                amount_sum = payments.aggregate(
-                    models.Sum('amount'))['amount__sum']
-                data['amount'] = amount_sum - amount_paid_sum
-                data['roommate_name'] = roommate.name
-                if data['amount'] > 0.00:
-                    amounts.append(data)
+            amount = balances.get((self.id, roommate.id))
+            if amount is not None and amount > 0.00:
+                amounts.append({
+                    'amount': amount,
+                    'roommate_name': roommate.name,
+                })
         return amounts
 
 
+class RecurringBillQuerySet(ShardedQuerySet):
+    def due(self, period):
+        # Active templates that have no bill for period yet
+        return self.filter(active=True).exclude(bills__period=period)
+
+    def create_bills(self, period):
+        # One insert for the bills and one for their split payments, across
+        # however many houses the templates belong to
+        bills = [template.build_bill(period) for template in self]
+        with transaction.atomic(using=self.db):
+            bulk_insert(Bill, bills, using=self.db)
+            Payment.objects.using(self.db).create_for_bills(bills)
+        return bills
+
+
+class RecurringBill(models.Model):
+    name = models.CharField(max_length=200)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+    amount = models.DecimalField(max_digits=5, decimal_places=2)
+    owner = models.ForeignKey(Roommate, on_delete=models.CASCADE)
+    house = models.ForeignKey(House, on_delete=models.CASCADE, db_constraint=False)
+    # Days past the end of a short month fall on its last day
+    day_of_month = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1), MaxValueValidator(31)])
+    active = models.BooleanField(default=True)
+
+    objects = RecurringBillQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+    def build_bill(self, period):
+        # period is the first day of the month to bill
+        # Clamped both ways, as rows saved without validation can hold any
+        # day, and one bad template must not stop a whole run
+        day = min(max(self.day_of_month, 1), calendar.monthrange(period.year, period.month)[1])
+        due_date = timezone.make_aware(datetime.combine(period.replace(day=day), time()))
+        return Bill(
+            name=self.name,
+            amount=self.amount,
+            owner_id=self.owner_id,
+            house_id=self.house_id,
+            due_date=due_date,
+            recurring_bill=self,
+            period=period,
+        )
+
+
+class BillQuerySet(ShardedQuerySet):
+    def with_totals(self):
+        total_paid = Coalesce(
+            models.Sum('payment__amount_paid'),
+            models.Value(0),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+        return self.annotate(
+            total_paid=total_paid,
+            total_due=models.ExpressionWrapper(
+                models.F('amount') - total_paid,
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+        )
+
+
 class Bill(models.Model):
     name = models.CharField(max_length=200)
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
     amount = models.DecimalField(max_digits=5, decimal_places=2)
     owner = models.ForeignKey(Roommate, on_delete=models.CASCADE)
-    house = models.ForeignKey(House, on_delete=models.CASCADE, null=True)
+    house = models.ForeignKey(House, on_delete=models.CASCADE, null=True, db_constraint=False)
     due_date = models.DateTimeField(null=True)
+    recurring_bill = models.ForeignKey(RecurringBill, on_delete=models.SET_NULL, null=True, related_name='bills')
+    period = models.DateField(null=True)
+
+    objects = BillQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('recurring_bill', 'period')
+        indexes = [
+            models.Index(fields=['house', 'due_date'], name='houses_bill_house_due_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # What is still owed on the bill is owed to its owner, so a new
+        # owner takes it over in the ledger
+        using = kwargs.get('using') or router.db_for_write(Bill, instance=self)
+        with transaction.atomic(using=using):
+            previous_owner_id = None
+            if self.pk is not None:
+                previous_owner_id = Bill.objects.using(using).filter(id=self.pk).values_list(
+                    'owner_id', flat=True,
+                ).first()
+            super().save(*args, **kwargs)
+            if previous_owner_id is None or previous_owner_id == self.owner_id:
+                return
+            deltas = {}
+            for payer_id, due in Payment.objects.using(using).filter(bill_id=self.pk).annotate(
+                due=models.F('amount') - models.F('amount_paid'),
+            ).values_list('payer_id', 'due'):
+                for pair, delta in (((payer_id, previous_owner_id), -due), ((payer_id, self.owner_id), due)):
+                    deltas[pair] = deltas.get(pair, 0) + delta
+            RoommateBalance.objects.using(using).apply_deltas(deltas)
+
     @property
     def amount_due(self):
+        if hasattr(self, 'total_due'):
+            return self.total_due
         payments = self.payment_set.all()
         amount_paid_sum = payments.aggregate(
             models.Sum('amount_paid'))['amount_paid__sum']
@@ -91,19 +259,54 @@ class Bill(models.Model):
 
     @property
     def amount_paid(self):
+        if hasattr(self, 'total_paid'):
+            return self.total_paid
         payments = self.payment_set.all()
         return payments.aggregate(
             models.Sum('amount_paid'))['amount_paid__sum']
 
-    def create_split_payments(self):
-        roommate_count = self.house.roommate_set.count()
-        split_amount = self.amount / roommate_count
-        for roommate in self.house.roommate_set.all():
-            Payment.objects.create(
-                bill=self,
-                payer=roommate,
-                amount=split_amount,
-            )
+    def create_split_payments(self, strategy=None):
+        return Payment.objects.using(self._state.db).create_for_bills([self], strategy)
+
+
+class PaymentQuerySet(ShardedQuerySet):
+    def unpaid(self):
+        # Matches the predicate of the houses_payment_unpaid_idx partial
+        # index, so keep the two in step
+        return self.filter(amount_paid__lt=models.F('amount'))
+
+    def overdue(self, now=None):
+        # The owner's own share of a bill is never paid, so it isn't owed
+        return self.unpaid().filter(
+            bill__due_date__lt=now or timezone.now(),
+        ).exclude(
+            bill__owner_id=models.F('payer_id'),
+        ).select_related('payer', 'bill').order_by('bill__due_date', 'id')
+
+    def create_for_bills(self, bills, strategy=None):
+        # Split every bill among its house's roommates with one roommate
+        # query and one insert, however many bills and roommates there are
+        strategy = strategy or EqualSplit()
+        roommate_ids = {}
+        for roommate_id, house_id in Roommate.objects.using(self.db).filter(
+            house_id__in={bill.house_id for bill in bills},
+        ).order_by('id').values_list('id', 'house_id'):
+            roommate_ids.setdefault(house_id, []).append(roommate_id)
+
+        payments = []
+        deltas = {}
+        for bill in bills:
+            shares = strategy.split(bill.amount, roommate_ids.get(bill.house_id, []))
+            for roommate_id, amount in shares.items():
+                payments.append(Payment(bill=bill, payer_id=roommate_id, amount=amount))
+                pair = (roommate_id, bill.owner_id)
+                deltas[pair] = deltas.get(pair, 0) + amount
+
+        with transaction.atomic(using=self.db):
+            self.bulk_create(payments)
+            RoommateBalance.objects.using(self.db).apply_deltas(deltas)
+            bump_house_versions({bill.house_id for bill in bills})
+        return payments
 
 
 class Payment(models.Model):
@@ -114,9 +317,36 @@ class Payment(models.Model):
     created = models.DateTimeField(auto_now_add=True, null=True)
     modified = models.DateTimeField(auto_now=True, null=True)
 
+    objects = PaymentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['payer', 'bill'], name='houses_payment_payer_bill_idx'),
+        ]
+
     def __str__(self):
         return '{}'.format(self.amount)
 
+    def save(self, *args, **kwargs):
+        # Post the change in what is still owed to the ledger. Bulk inserts
+        # like create_for_bills and imports post their own deltas.
+        using = kwargs.get('using') or router.db_for_write(Payment, instance=self)
+        with transaction.atomic(using=using):
+            deltas = {}
+            if self.pk is not None:
+                previous = Payment.objects.using(using).filter(id=self.pk).annotate(
+                    due=models.F('amount') - models.F('amount_paid'),
+                ).values_list('payer_id', 'bill__owner_id', 'due')
+                for payer_id, owner_id, due in previous:
+                    deltas[(payer_id, owner_id)] = -due
+            super().save(*args, **kwargs)
+            amount, amount_paid = (
+                self._meta.get_field(name).to_python(getattr(self, name)) for name in ('amount', 'amount_paid')
+            )
+            pair = (self.payer_id, self.bill.owner_id)
+            deltas[pair] = deltas.get(pair, 0) + amount - amount_paid
+            RoommateBalance.objects.using(using).apply_deltas(deltas)
+
     @property
     def is_paid(self):
         return self.amount == self.amount_paid
@@ -129,9 +359,11 @@ class Payment(models.Model):
 class PaymentEvent(models.Model):
     payment = models.ForeignKey(Payment, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
-    created = models.DateTimeField(auto_now_add=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True, null=True)
 
+    objects = ShardedQuerySet.as_manager()
+
     def __str__(self):
         return '{payer} paid {amount} to {payee} for {bill}'.format(
             payer=self.payment.payer.name,
@@ -141,7 +373,131 @@ class PaymentEvent(models.Model):
         )
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        payment = self.payment
-        payment.amount_paid = Decimal(payment.amount_paid) + Decimal(self.amount)
-        payment.save()
+        # Post the payment with a single UPDATE so concurrent payments
+        # against the same row can't overwrite each other
+        using = kwargs.get('using') or router.db_for_write(PaymentEvent, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            payments = Payment.objects.using(using).filter(id=self.payment_id)
+            payments.update(
+                amount_paid=models.F('amount_paid') + Decimal(self.amount),
+                modified=timezone.now(),
+            )
+            # The UPDATE holds the row until commit, so this reads our own
+            # total rather than one a concurrent payment wrote after it
+            payer_id, owner_id, amount_paid, modified = payments.values_list(
+                'payer_id', 'bill__owner_id', 'amount_paid', 'modified',
+            ).get()
+            RoommateBalance.objects.using(using).apply_deltas({
+                (payer_id, owner_id): -Decimal(self.amount),
+            })
+        if PaymentEvent.payment.is_cached(self):
+            self.payment.amount_paid, self.payment.modified = amount_paid, modified
+
+
+class RoommateBalanceQuerySet(ShardedQuerySet):
+    def apply_deltas(self, deltas, batch_size=250):
+        # deltas maps (debtor_id, creditor_id) to the change in what the
+        # debtor owes the creditor
+        deltas = {
+            pair: Decimal(delta) for pair, delta in deltas.items()
+            if pair[0] != pair[1] and delta
+        }
+        pairs = list(deltas)
+        for i in range(0, len(pairs), batch_size):
+            self._apply_deltas({pair: deltas[pair] for pair in pairs[i:i + batch_size]})
+
+    def _apply_deltas(self, deltas):
+        debtor_ids = {debtor_id for debtor_id, creditor_id in deltas}
+        creditor_ids = {creditor_id for debtor_id, creditor_id in deltas}
+        existing = {
+            (debtor_id, creditor_id): balance_id
+            for balance_id, debtor_id, creditor_id in self.filter(
+                debtor_id__in=debtor_ids,
+                creditor_id__in=creditor_ids,
+            ).values_list('id', 'debtor_id', 'creditor_id')
+            if (debtor_id, creditor_id) in deltas
+        }
+        missing = [pair for pair in deltas if pair not in existing]
+        if missing:
+            house_ids = dict(Roommate.objects.using(self.db).filter(
+                id__in={debtor_id for debtor_id, creditor_id in missing},
+            ).values_list('id', 'house_id'))
+            try:
+                with transaction.atomic(using=self.db):
+                    self.bulk_create([
+                        RoommateBalance(
+                            house_id=house_ids[debtor_id],
+                            debtor_id=debtor_id,
+                            creditor_id=creditor_id,
+                            amount=deltas[(debtor_id, creditor_id)],
+                        )
+                        for debtor_id, creditor_id in missing
+                    ])
+            except IntegrityError:
+                # Another request created some of these pairs in the
+                # meantime. Those rows exist now, so go again and add to them.
+                self._apply_deltas({pair: deltas[pair] for pair in missing})
+        if existing:
+            delta = models.Case(
+                *[
+                    models.When(id=balance_id, then=models.Value(deltas[pair]))
+                    for pair, balance_id in existing.items()
+                ],
+                output_field=models.DecimalField(max_digits=10, decimal_places=2)
+            )
+            self.filter(id__in=existing.values()).update(amount=models.F('amount') + delta)
+
+    def rebuild(self, house):
+        balances = self.using(router.db_for_write(RoommateBalance, instance=house))
+        with transaction.atomic(using=balances.db):
+            balances.filter(house=house).delete()
+            return balances.bulk_create([
+                RoommateBalance(
+                    house=house,
+                    debtor_id=debtor_id,
+                    creditor_id=creditor_id,
+                    amount=amount,
+                )
+                for (debtor_id, creditor_id), amount in house.balance_matrix().items()
+            ])
+
+    def owed_from_roommates(self, roommate):
+        return self.filter(creditor=roommate).select_related('debtor').order_by('debtor_id')
+
+    def owed_to_roommates(self, roommate):
+        return self.filter(
+            debtor=roommate,
+            amount__gt=0,
+        ).select_related('creditor').order_by('creditor_id')
+
+    def amounts_owed_from_roommates(self, roommate):
+        return [
+            {'amount': balance.amount, 'roommate_name': balance.debtor.name}
+            for balance in self.owed_from_roommates(roommate)
+        ]
+
+    def amounts_owed_to_roommates(self, roommate):
+        return [
+            {'amount': balance.amount, 'roommate_name': balance.creditor.name}
+            for balance in self.owed_to_roommates(roommate)
+        ]
+
+
+class RoommateBalance(models.Model):
+    house = models.ForeignKey(House, on_delete=models.CASCADE, db_constraint=False)
+    debtor = models.ForeignKey(Roommate, on_delete=models.CASCADE, related_name='debts')
+    creditor = models.ForeignKey(Roommate, on_delete=models.CASCADE, related_name='credits')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+
+    objects = RoommateBalanceQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('debtor', 'creditor')
+
+    def __str__(self):
+        return '{debtor} owes {amount} to {creditor}'.format(
+            debtor=self.debtor.name,
+            amount=self.amount,
+            creditor=self.creditor.name,
+        )
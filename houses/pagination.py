@@ -0,0 +1,23 @@
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(event):
+    # Keyset cursor pointing just past event in (created, id) order
+    micros = (event.created - EPOCH) // timedelta(microseconds=1)
+    return '{}-{}'.format(micros, event.id)
+
+
+def decode_cursor(value):
+    micros, event_id = value.split('-')
+    return EPOCH + timedelta(microseconds=int(micros)), int(event_id)
+
+
+def keyset_page(queryset, size):
+    # Fetch one row past the page to find out whether there is another one
+    rows = list(queryset[:size + 1])
+    next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else None
+    return rows[:size], next_cursor
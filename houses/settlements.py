@@ -0,0 +1,45 @@
+import heapq
+
+
+def net_positions(balances):
+    # What each roommate is owed overall (negative if they owe money)
+    positions = {}
+    for (debtor_id, creditor_id), amount in balances.items():
+        positions[debtor_id] = positions.get(debtor_id, 0) - amount
+        positions[creditor_id] = positions.get(creditor_id, 0) + amount
+    return positions
+
+
+def plan_transfers(positions):
+    # Greedily pay the largest creditor from the largest debtor until every
+    # position is settled, which needs at most one transfer per roommate.
+    creditors = [(-amount, roommate_id) for roommate_id, amount in positions.items() if amount > 0]
+    debtors = [(amount, roommate_id) for roommate_id, amount in positions.items() if amount < 0]
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+    transfers = []
+    while creditors and debtors:
+        credit, creditor_id = heapq.heappop(creditors)
+        debt, debtor_id = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor_id, creditor_id, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor_id))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor_id))
+    return transfers
+
+
+def plan_settlement(house):
+    transfers = plan_transfers(net_positions(house.balance_matrix()))
+    names = dict(house.roommate_set.values_list('id', 'name'))
+    return [
+        {
+            'payer_id': debtor_id,
+            'payer_name': names[debtor_id],
+            'payee_id': creditor_id,
+            'payee_name': names[creditor_id],
+            'amount': amount,
+        }
+        for debtor_id, creditor_id, amount in transfers
+    ]
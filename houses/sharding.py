@@ -0,0 +1,217 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count
+
+from core.bulk import chunked
+
+from .cache import bump_house_versions
+from .idblocks import highest_id, id_range, set_sqlite_sequence, sqlite_sequence_top
+from .models import House, Roommate, RecurringBill, Bill, Payment, PaymentEvent, RoommateBalance
+
+# Everything stored on a house's shard, parents before children, with the
+# lookup from each model to its house
+SHARDED_MODELS = OrderedDict([
+    (Roommate, 'house_id'),
+    (RecurringBill, 'house_id'),
+    (Bill, 'owner__house_id'),
+    (Payment, 'payer__house_id'),
+    (PaymentEvent, 'payment__payer__house_id'),
+    (RoommateBalance, 'house_id'),
+])
+
+MOVE_BATCH_SIZE = 500
+
+_state = threading.local()
+
+
+def shard_aliases():
+    # Houses created before sharding was set up keep their data on default
+    return [DEFAULT_DB_ALIAS] + settings.DATABASE_SHARDS
+
+
+@contextmanager
+def use_shard(alias):
+    # Send Model.objects queries for house data in this block to alias.
+    # Queries through a house or one of its rows find the shard themselves.
+    previous = getattr(_state, 'shard', None)
+    _state.shard = alias
+    try:
+        yield
+    finally:
+        _state.shard = previous
+
+
+def use_house_shard(house_id):
+    return use_shard(House.objects.shard_for(house_id))
+
+
+def houses_by_shard(houses):
+    groups = OrderedDict()
+    for house in houses:
+        groups.setdefault(house.shard, []).append(house)
+    return groups
+
+
+class HouseShardRouter:
+    # Routes house data to the shard of the House or row passed as a hint,
+    # else to the one chosen with use_shard(). The default database is left
+    # to the routers after this one, so replicas still apply there.
+    def db_for_read(self, model, **hints):
+        if model not in SHARDED_MODELS:
+            return None
+        instance = hints.get('instance')
+        if isinstance(instance, House):
+            shard = instance.shard
+        elif instance is not None and instance._state.db in settings.DATABASE_SHARDS:
+            shard = instance._state.db
+        elif getattr(instance, 'house_id', None):
+            shard = House.objects.shard_for(instance.house_id)
+        else:
+            shard = getattr(_state, 'shard', None)
+        return shard if shard and shard != DEFAULT_DB_ALIAS else None
+
+    db_for_write = db_for_read
+
+
+def reserve_id_range(alias):
+    # Point the shard's id sequences into its block, the first one for
+    # default. Safe to repeat: it only moves a sequence forward, or back
+    # into the block after rows copied in from another shard dragged it out.
+    start, end = id_range(alias)
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in SHARDED_MODELS:
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                set_sqlite_sequence(cursor, table, sqlite_sequence_top(connection, cursor, table, start, end))
+            elif connection.vendor == 'postgresql':
+                highest = highest_id(connection, cursor, table, start, end)
+                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+                sequence = cursor.fetchone()[0]
+                cursor.execute('SELECT last_value FROM {}'.format(sequence))
+                if cursor.fetchone()[0] < highest:
+                    cursor.execute('SELECT setval(%s, %s)', [sequence, highest])
+            else:
+                raise NotImplementedError('Shard id blocks need SQLite or PostgreSQL, not {}'.format(connection.vendor))
+
+
+def house_rows(model, house_id, using):
+    return model.objects.using(using).filter(**{SHARDED_MODELS[model]: house_id}).order_by('id')
+
+
+def house_id_of(instance):
+    # Follow the model's lookup to its house, for rows not saved yet too
+    if isinstance(instance, House):
+        return instance.id
+    value = instance
+    for name in SHARDED_MODELS[type(instance)].split('__'):
+        value = getattr(value, name)
+    return value
+
+
+def delete_house_rows(house_id, using):
+    # One DELETE per model, children first, without loading the rows or
+    # sending signals. For data that is being dropped along with its house
+    # or was copied elsewhere, so there is no ledger or cache to update.
+    with transaction.atomic(using=using):
+        for model in reversed(SHARDED_MODELS):
+            house_rows(model, house_id, using).order_by()._raw_delete(using)
+
+
+@contextmanager
+def lock_houses(house_ids, shard):
+    # Hold the directory rows of houses about to be written to until the
+    # block ends. move_house flags a house with an UPDATE, which waits for
+    # the lock, so writes that got in first are committed before it copies
+    # anything. Yields the ids that live on shard and aren't being moved;
+    # write only to those.
+    if not settings.DATABASE_SHARDS:
+        yield set(house_ids)
+        return
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        yield set(House.objects.using(DEFAULT_DB_ALIAS).select_for_update().filter(
+            id__in=house_ids,
+            shard=shard,
+            moving_to='',
+        ).order_by('id').values_list('id', flat=True))
+
+
+def move_house(house, target):
+    # Copy the house's rows to target with their ids, point the directory
+    # at target, then delete the originals. Writes to the house are refused
+    # while moving_to is set, and the flag waits for writes holding
+    # lock_houses() to finish. Returns the number of rows moved.
+    source = house.shard
+    if target == source:
+        return 0
+    if target not in shard_aliases():
+        raise ValueError('Unknown shard {}'.format(target))
+
+    House.objects.filter(id=house.id).update(moving_to=target)
+    try:
+        moved = 0
+        with transaction.atomic(using=target):
+            # Rows left behind by an attempt that failed before the switch
+            delete_house_rows(house.id, target)
+            for model in SHARDED_MODELS:
+                fields = model._meta.concrete_fields
+                for rows in chunked(house_rows(model, house.id, source).iterator(), MOVE_BATCH_SIZE):
+                    # raw keeps created and modified as they are
+                    model.objects.using(target)._insert(rows, fields=fields, raw=True)
+                    moved += len(rows)
+            if connections[target].vendor == 'sqlite':
+                reserve_id_range(target)
+        House.objects.filter(id=house.id).update(shard=target, moving_to='')
+    except Exception:
+        House.objects.filter(id=house.id).update(moving_to='')
+        raise
+
+    delete_house_rows(house.id, source)
+    house.shard, house.moving_to = target, ''
+    bump_house_versions([house.id])
+    return moved
+
+
+def house_loads():
+    # Rows per house on every shard, counting payments and the house itself
+    loads = {}
+    for alias in shard_aliases():
+        loads.update(Payment.objects.using(alias).values_list('payer__house_id').annotate(
+            Count('id'),
+        ).order_by())
+    return {
+        house_id: (shard, loads.get(house_id, 0) + 1)
+        for house_id, shard in House.objects.values_list('id', 'shard')
+    }
+
+
+def plan_moves(houses, shards):
+    # houses maps house id to (shard, load). Greedily move the largest
+    # house that still narrows the gap from the most to the least loaded
+    # shard; every move strictly evens the shards out, so this stops.
+    houses = dict(houses)
+    loads = {shard: 0 for shard in shards}
+    for shard, load in houses.values():
+        if shard in loads:
+            loads[shard] += load
+    moves = []
+    while len(loads) > 1:
+        heavy = max(shards, key=lambda shard: loads[shard])
+        light = min(shards, key=lambda shard: loads[shard])
+        gap = loads[heavy] - loads[light]
+        candidates = [
+            (load, house_id) for house_id, (shard, load) in houses.items()
+            if shard == heavy and load < gap
+        ]
+        if not candidates:
+            break
+        load, house_id = max(candidates)
+        moves.append((house_id, heavy, light))
+        houses[house_id] = (light, load)
+        loads[heavy] -= load
+        loads[light] += load
+    return moves
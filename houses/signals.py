@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import DecimalField, F, Subquery
+from django.db.models.signals import post_migrate, post_save, pre_delete, pre_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_house_versions
+from .idblocks import assign_ids
+from .models import House, Roommate, Bill, Payment, PaymentEvent, RoommateBalance
+from .sharding import SHARDED_MODELS, delete_house_rows, reserve_id_range
+
+
+def payer_house_ids(payer_ids, using):
+    return Roommate.objects.using(using).filter(id__in=payer_ids).values_list('house_id', flat=True)
+
+
+@receiver([post_save, post_delete], sender=House)
+def house_changed(sender, instance, **kwargs):
+    bump_house_versions([instance.id])
+
+
+@receiver(pre_delete, sender=House)
+def house_deleted(sender, instance, **kwargs):
+    # The cascade only reaches rows on the house's own database. This also
+    # runs for houses deleted along with their creator, whose cascade
+    # never calls House.delete().
+    if instance.shard and instance.shard != DEFAULT_DB_ALIAS:
+        delete_house_rows(instance.id, instance.shard)
+
+
+@receiver([post_save, post_delete], sender=Roommate)
+@receiver([post_save, post_delete], sender=Bill)
+def house_child_changed(sender, instance, **kwargs):
+    bump_house_versions([instance.house_id])
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def payment_changed(sender, instance, using, **kwargs):
+    bump_house_versions(payer_house_ids([instance.payer_id], using))
+
+
+@receiver(pre_delete, sender=Payment)
+def payment_deleted(sender, instance, using, **kwargs):
+    # Take what was still owed on the payment off the ledger, reading it
+    # from the row rather than a possibly stale instance. This also runs for
+    # payments deleted along with their bill or roommate; the balance row
+    # may go in the same cascade, so it is only ever updated here.
+    payment = Payment.objects.using(using).filter(id=instance.id)
+    RoommateBalance.objects.using(using).filter(
+        debtor_id=instance.payer_id,
+        creditor_id=Subquery(payment.values('bill__owner_id')),
+    ).update(amount=F('amount') - Subquery(
+        payment.annotate(due=F('amount') - F('amount_paid')).values('due'),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+@receiver([post_save, post_delete], sender=PaymentEvent)
+def payment_event_changed(sender, instance, using, **kwargs):
+    bump_house_versions(payer_house_ids(
+        Payment.objects.using(using).filter(id=instance.payment_id).values('payer_id'),
+        using,
+    ))
+
+
+@receiver(post_migrate)
+def shard_migrated(sender, using, **kwargs):
+    if sender.name == 'houses' and using in settings.DATABASE_SHARDS:
+        reserve_id_range(using)
+
+
+@receiver(pre_save)
+def sharded_row_saved(sender, instance, using, raw, **kwargs):
+    if sender in SHARDED_MODELS and not raw:
+        assign_ids(sender, [instance], using)
@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from decimal import Decimal, ROUND_FLOOR
+
+CENT = Decimal('0.01')
+
+
+def allocate(total, weights):
+    # Split total across the keys of weights in proportion to each weight.
+    # Every share is a whole number of cents and the shares always add up to
+    # total: cents left over after flooring go to the largest remainders.
+    cents = int(Decimal(total).quantize(CENT) / CENT)
+    weight_sum = sum(Decimal(weight) for weight in weights.values())
+    if weight_sum <= 0:
+        raise ValueError('Weights must add up to more than zero.')
+    shares = OrderedDict()
+    remainders = []
+    for index, (key, weight) in enumerate(weights.items()):
+        exact = cents * Decimal(weight) / weight_sum
+        share = int(exact.to_integral_value(rounding=ROUND_FLOOR))
+        shares[key] = share
+        remainders.append((exact - share, -index, key))
+    leftover = cents - sum(shares.values())
+    for remainder, index, key in sorted(remainders, reverse=True)[:leftover]:
+        shares[key] += 1
+    return OrderedDict((key, share * CENT) for key, share in shares.items())
+
+
+class EqualSplit:
+    def split(self, total, roommate_ids):
+        return allocate(total, OrderedDict((roommate_id, 1) for roommate_id in roommate_ids))
+
+
+class WeightedSplit:
+    def __init__(self, weights):
+        self.weights = weights
+
+    def split(self, total, roommate_ids):
+        return allocate(total, OrderedDict(
+            (roommate_id, self.weights.get(roommate_id, 0)) for roommate_id in roommate_ids
+        ))
+
+
+class PercentageSplit(WeightedSplit):
+    def split(self, total, roommate_ids):
+        if sum(Decimal(self.weights.get(roommate_id, 0)) for roommate_id in roommate_ids) != 100:
+            raise ValueError('Percentages must add up to 100.')
+        return super().split(total, roommate_ids)
+
+
+class FixedSplit:
+    # Roommates with a fixed amount pay exactly that, everyone else splits
+    # what is left equally.
+    def __init__(self, amounts):
+        self.amounts = amounts
+
+    def split(self, total, roommate_ids):
+        fixed = OrderedDict(
+            (roommate_id, Decimal(self.amounts[roommate_id]).quantize(CENT))
+            for roommate_id in roommate_ids if roommate_id in self.amounts
+        )
+        rest = [roommate_id for roommate_id in roommate_ids if roommate_id not in fixed]
+        remaining = Decimal(total).quantize(CENT) - sum(fixed.values())
+        if remaining < 0 or (remaining and not rest):
+            raise ValueError('Fixed amounts must add up to the bill amount.')
+        shares = EqualSplit().split(remaining, rest) if rest else {}
+        return OrderedDict(
+            (roommate_id, fixed.get(roommate_id, shares.get(roommate_id)))
+            for roommate_id in roommate_ids
+        )
@@ -0,0 +1,115 @@
+from faker import Faker
+
+from django.test import TestCase
+from django.urls import reverse
+
+from core import factories
+from houses.models import House, Roommate, Bill
+
+fake = Faker()
+
+
+class APIDataMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = factories.create_fake_user()
+        cls.houses = []
+        for i in range(3):
+            house = House.objects.create(name=fake.address(), creator=cls.user)
+            owner = Roommate.objects.create(name=fake.first_name(), house=house)
+            Roommate.objects.create(name=fake.first_name(), house=house)
+            bill = Bill.objects.create(name='Heat', amount=30.00, owner=owner, house=house)
+            bill.create_split_payments()
+            cls.houses.append(house)
+        cls.other_house = factories.HouseFactory()
+
+
+class AnonUserFetchesHouses(TestCase):
+    def test_access_is_denied(self):
+        response = self.client.get(reverse('api_house_list'))
+        self.assertEqual(response.status_code, 403)
+
+
+class UserFetchesHouses(APIDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_only_own_houses_are_listed(self):
+        data = self.client.get(reverse('api_house_list')).json()['data']
+        self.assertEqual([house['id'] for house in data], [house.id for house in self.houses])
+
+    def test_batched_ids(self):
+        ids = [self.houses[0].id, self.houses[2].id, self.other_house.id]
+        response = self.client.get(reverse('api_house_list'), {'ids': ','.join(map(str, ids))})
+        self.assertEqual([house['id'] for house in response.json()['data']], ids[:2])
+
+    def test_invalid_ids(self):
+        response = self.client.get(reverse('api_house_list'), {'ids': '1,x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sparse_fieldsets(self):
+        response = self.client.get(reverse('api_house_list'), {
+            'fields': 'name',
+            'fields[bill]': 'amount_due',
+            'include': 'bills',
+        })
+        document = response.json()
+        self.assertEqual(set(document['data'][0]), {'id', 'name'})
+        self.assertEqual(document['included']['bills'][0], {
+            'id': self.houses[0].bill_set.get().id,
+            'amount_due': '30.00',
+        })
+
+    def test_compound_document(self):
+        response = self.client.get(reverse('api_house_list'), {
+            'include': 'bills,roommates,balances,payments',
+        })
+        included = response.json()['included']
+        self.assertEqual(len(included['bills']), 3)
+        self.assertEqual(len(included['roommates']), 6)
+        self.assertEqual(len(included['balances']), 3)
+        self.assertEqual(len(included['payments']), 6)
+
+    def test_unknown_include(self):
+        response = self.client.get(reverse('api_house_list'), {'include': 'users'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_does_not_grow_with_houses(self):
+        params = {'include': 'bills,roommates,balances,payments'}
+        self.client.get(reverse('api_house_list'), params)
+        # Plus one query each for the session and the user
+        with self.assertNumQueries(7):
+            self.client.get(reverse('api_house_list'), params)
+
+
+class UserFetchesHouse(APIDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_house(self):
+        house = self.houses[1]
+        response = self.client.get(reverse('api_house_detail', args=(house.id,)))
+        self.assertEqual(response.json()['data']['name'], house.name)
+
+    def test_other_users_house(self):
+        response = self.client.get(reverse('api_house_detail', args=(self.other_house.id,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class UserFetchesBill(APIDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.bill = self.houses[0].bill_set.get()
+        self.response = self.client.get(
+            reverse('api_bill_detail', args=(self.bill.id,)),
+            {'include': 'payments'},
+        )
+
+    def test_bill(self):
+        data = self.response.json()['data']
+        self.assertEqual(data['amount'], '30.00')
+        self.assertEqual(data['amount_paid'], '0.00')
+
+    def test_payments_are_included(self):
+        payments = self.response.json()['included']['payments']
+        self.assertEqual([payment['amount'] for payment in payments], ['15.00', '15.00'])
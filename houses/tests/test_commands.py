@@ -0,0 +1,318 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+from io import StringIO
+from unittest import mock
+from faker import Faker
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.http.response import HttpResponse, HttpResponsePermanentRedirect
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmarks.plans import explain
+from benchmarks.views import time_connection_reuse, time_view, time_views
+from core import factories
+from core.factories import seed_house
+from houses import urls
+from houses.models import (
+    House, Roommate, Bill, Payment, PaymentEvent, RecurringBill, RecurringBillQuerySet, RoommateBalance,
+)
+
+fake = Faker()
+
+
+class LedgerDataMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = factories.create_fake_user()
+        cls.house = House.objects.create(
+            creator=cls.user,
+            name=fake.address(),
+        )
+        # Imports match roommates by name, so the two must never collide
+        cls.owner = Roommate.objects.create(name=fake.first_name(), house=cls.house)
+        cls.payer = Roommate.objects.create(name=fake.name(), house=cls.house)
+        cls.bill = Bill.objects.create(
+            name='Internet',
+            amount=40.00,
+            owner=cls.owner,
+            house=cls.house,
+        )
+        # Inserted without posting to the ledger, as before it existed
+        Payment.objects.bulk_create([
+            Payment(bill=cls.bill, amount=20.00, payer=cls.owner),
+            Payment(bill=cls.bill, amount=20.00, payer=cls.payer),
+        ])
+
+
+class RebuildBalances(LedgerDataMixin, TestCase):
+    def setUp(self):
+        call_command('rebuild_balances', stdout=StringIO())
+
+    def test_balances_are_rebuilt(self):
+        balance = RoommateBalance.objects.get()
+        self.assertEqual(balance.debtor_id, self.payer.id)
+        self.assertEqual(balance.creditor_id, self.owner.id)
+        self.assertEqual(balance.amount, 20.00)
+
+    def test_check_passes_after_rebuild(self):
+        call_command('rebuild_balances', check=True, stdout=StringIO())
+
+
+class CheckBalancesDrift(LedgerDataMixin, TestCase):
+    def test_drift_is_reported(self):
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_balances', check=True, stdout=out)
+        self.assertIn('House {}'.format(self.house.id), out.getvalue())
+        self.assertEqual(RoommateBalance.objects.count(), 0)
+
+
+class SeedBenchmarkHouse(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.house = seed_house(4, 30, 20, split_size=3, batch_size=8)
+
+    def test_house_is_seeded(self):
+        self.assertEqual(self.house.roommate_set.count(), 4)
+        self.assertEqual(self.house.bill_set.count(), 30)
+        self.assertEqual(Payment.objects.filter(bill__house=self.house).count(), 90)
+        self.assertEqual(PaymentEvent.objects.filter(payment__bill__house=self.house).count(), 20)
+
+    def test_payments_match_events(self):
+        paid = Payment.objects.aggregate(total=Sum('amount_paid'))['total']
+        posted = PaymentEvent.objects.aggregate(total=Sum('amount'))['total']
+        self.assertEqual(paid, posted)
+
+    def test_ledger_is_rebuilt(self):
+        out = StringIO()
+        call_command('rebuild_balances', self.house.id, check=True, stdout=out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_streamed_queries_are_counted(self):
+        client = Client()
+        client.force_login(self.house.creator)
+        url = reverse('house_ledger_export', args=(self.house.id,))
+        with CaptureQueriesContext(connection) as captured:
+            b''.join(client.get(url).streaming_content)
+        queries = len(captured)
+        result = time_view(client, url, 3)
+        self.assertEqual(result['queries'], queries)
+        self.assertEqual(result['max_queries'], queries)
+
+    def test_every_view_is_timed(self):
+        results = time_views(self.house, 2)
+        self.assertEqual(set(results), {pattern.name for pattern in urls.urlpatterns})
+        for name, result in results.items():
+            status = HttpResponsePermanentRedirect.status_code if name == 'payment_redirect' else HttpResponse.status_code
+            self.assertEqual(result['status'], status, name)
+
+
+class SeedLedger(TestCase):
+    def setUp(self):
+        call_command(
+            'seed_ledger',
+            houses=2,
+            roommates=3,
+            bills=10,
+            events=5,
+            seed=1,
+            stdout=StringIO(),
+        )
+
+    def ledger(self, house):
+        return (
+            list(house.roommate_set.order_by('id').values_list('name')),
+            list(house.bill_set.order_by('id').values_list('name', 'amount', 'owner__name')),
+            list(Payment.objects.filter(bill__house=house).order_by('id').values_list(
+                'amount', 'amount_paid', 'payer__name',
+            )),
+            list(PaymentEvent.objects.filter(payment__bill__house=house).order_by('id').values_list(
+                'amount', 'payment__payer__name',
+            )),
+        )
+
+    def test_seed_repeats_the_data(self):
+        first = House.objects.order_by('id').first()
+        call_command('seed_ledger', roommates=3, bills=10, events=5, seed=1, stdout=StringIO())
+        again = House.objects.order_by('id').last()
+        self.assertEqual(again.name, first.name)
+        self.assertEqual(self.ledger(again), self.ledger(first))
+
+    def test_houses_are_seeded(self):
+        self.assertEqual(House.objects.count(), 2)
+        self.assertEqual(Roommate.objects.count(), 6)
+        self.assertEqual(Bill.objects.count(), 20)
+        self.assertEqual(Payment.objects.count(), 60)
+        self.assertEqual(PaymentEvent.objects.count(), 10)
+
+
+class ExportLedger(LedgerDataMixin, TestCase):
+    def test_house_ledger_is_written(self):
+        out = StringIO()
+        call_command('export_ledger', house=self.house.id, stdout=out)
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual(rows[0][0], 'type')
+        self.assertEqual([row[0] for row in rows[1:]], ['bill', 'payment', 'payment'])
+
+    def test_missing_house(self):
+        with self.assertRaises(CommandError):
+            call_command('export_ledger', house=0, stdout=StringIO())
+
+
+class ImportLedger(LedgerDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        PaymentEvent.objects.create(payment=cls.payer.payment_set.get(), amount=5.00)
+        Bill.objects.filter(id=cls.bill.id).update(created='2015-03-01T12:00:00Z')
+        PaymentEvent.objects.update(created='2015-03-02T12:00:00Z')
+        cls.target = House.objects.create(creator=cls.user, name=fake.address())
+        Roommate.objects.create(name=cls.owner.name, house=cls.target)
+        Roommate.objects.create(name=cls.payer.name, house=cls.target)
+
+    def export(self):
+        out = StringIO()
+        call_command('export_ledger', house=self.house.id, stdout=out)
+        return out.getvalue()
+
+    def import_ledger(self, data, **options):
+        path = os.path.join(self.tmpdir, 'ledger.csv')
+        with open(path, 'w') as f:
+            f.write(data)
+        out = StringIO()
+        call_command('import_ledger', self.target.id, path, stdout=out, **options)
+        return out.getvalue()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_exported_ledger_is_imported(self):
+        out = self.import_ledger(self.export(), chunk_size=2)
+        self.assertIn('Chunk 2: 2 rows, 0 bills, 1 payments, 1 payment events', out)
+        bill = Bill.objects.get(house=self.target)
+        self.assertEqual(bill.created.year, 2015)
+        self.assertEqual(bill.payment_set.count(), 2)
+        event = PaymentEvent.objects.get(payment__bill=bill)
+        self.assertEqual(event.created.date(), date(2015, 3, 2))
+        self.assertEqual(bill.amount_due, 35.00)
+
+    def test_balances_are_posted(self):
+        self.import_ledger(self.export())
+        balance = RoommateBalance.objects.get(house=self.target)
+        self.assertEqual(balance.debtor.name, self.payer.name)
+        self.assertEqual(balance.amount, 15.00)
+        call_command('rebuild_balances', self.target.id, check=True, stdout=StringIO())
+
+    def test_invalid_rows_are_reported(self):
+        data = self.export().replace(self.payer.name, 'Nobody')
+        with self.assertRaises(CommandError):
+            self.import_ledger(data)
+        self.assertEqual(Bill.objects.filter(house=self.target).count(), 1)
+        self.assertEqual(Payment.objects.filter(bill__house=self.target).count(), 1)
+        self.assertEqual(PaymentEvent.objects.filter(payment__bill__house=self.target).count(), 0)
+
+
+class GenerateRecurringBills(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for house in factories.HouseFactory.create_batch(3):
+            owner, payer = factories.RoommateFactory.create_batch(2, house=house)
+            RecurringBill.objects.create(name='Rent', amount=50.00, owner=owner, house=house, day_of_month=15)
+        RecurringBill.objects.create(name='Gym', amount=10.00, owner=owner, house=house, active=False)
+
+    def generate(self, **options):
+        out = StringIO()
+        call_command('generate_recurring_bills', period='2026-10', batch_size=2, stdout=out, **options)
+        return out.getvalue()
+
+    def test_bills_are_created_for_every_house(self):
+        self.assertIn('Created 3 bills for 2026-10', self.generate())
+        self.assertEqual(Bill.objects.filter(period='2026-10-01').count(), 3)
+        self.assertEqual(Payment.objects.count(), 6)
+        self.assertEqual(RoommateBalance.objects.aggregate(Sum('amount'))['amount__sum'], 75.00)
+
+    def test_rerun_creates_nothing(self):
+        self.generate()
+        self.assertIn('Created 0 bills', self.generate())
+        self.assertEqual(Bill.objects.count(), 3)
+
+    def test_concurrent_run_only_skips_its_own_bills(self):
+        # Another run bills the first template after this one has read it
+        first = RecurringBill.objects.order_by('id').first()
+        RecurringBill.objects.filter(id=first.id).create_bills(date(2026, 10, 1))
+        err = StringIO()
+        with mock.patch.object(RecurringBillQuerySet, 'due', lambda templates, period: templates.filter(active=True)):
+            out = self.generate(stderr=err)
+        self.assertIn('Created 2 bills', out)
+        self.assertIn('Skipped recurring bill {}: already generated'.format(first.id), err.getvalue())
+        self.assertEqual(Bill.objects.count(), 3)
+
+    def test_invalid_period(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_recurring_bills', period='October', stdout=StringIO())
+
+    def test_out_of_range_day_is_clamped(self):
+        RecurringBill.objects.filter(day_of_month=15).update(day_of_month=0)
+        self.assertIn('Created 3 bills', self.generate())
+        self.assertEqual({timezone.localtime(bill.due_date).day for bill in Bill.objects.all()}, {1})
+
+    def test_day_of_month_is_validated(self):
+        template = RecurringBill.objects.first()
+        for day in (0, 32):
+            template.day_of_month = day
+            with self.assertRaises(ValidationError):
+                template.full_clean()
+
+
+class ExplainHotpaths(LedgerDataMixin, TestCase):
+    def test_report_covers_hot_querysets(self):
+        out = StringIO()
+        call_command('explain_hotpaths', house=self.house.id, check=True, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['house_id'], self.house.id)
+        self.assertIn('roommate.payment_history', report['queries'])
+        self.assertIn('bill.amount_due', report['queries'])
+        self.assertEqual(report['flagged'], {})
+
+    def test_sequential_scan_is_flagged(self):
+        result = explain(Bill.objects.filter(name='Internet'))
+        self.assertEqual([scan['table'] for scan in result['seq_scans']], ['houses_bill'])
+
+    def test_empty_database(self):
+        Bill.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('explain_hotpaths', stdout=StringIO())
+
+
+class StartupProfile(SimpleTestCase):
+    def test_every_import_is_timed(self):
+        out = StringIO()
+        call_command('startup_profile', sort='cumulative', limit=0, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[1].endswith('  settings.wsgi'))
+        self.assertTrue(any(line.endswith('  houses.models') for line in lines))
+        self.assertTrue(lines[-1].startswith('Imported settings.wsgi in'))
+
+    def test_failed_import_is_reported(self):
+        with self.assertRaisesMessage(CommandError, 'Importing houses.missing failed'):
+            call_command('startup_profile', module='houses.missing', stdout=StringIO())
+
+
+class ConnectionReuseBench(TransactionTestCase):
+    def test_each_conn_max_age_is_timed(self):
+        house = seed_house(2, 2, 0)
+        results = time_connection_reuse(house, [0, 60], 3)
+        self.assertEqual(set(results), {'0', '60'})
+        self.assertLessEqual(results['60']['connects'], 1)
@@ -1,10 +1,22 @@
+import threading
+from datetime import date, timedelta
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import skipUnless
 from decimal import Decimal
 from faker import Faker
 
-from django.test import TestCase
+from django.apps import apps
+from django.db import connection
+from django.db.models import F
+from django.db.models.signals import pre_save
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
 
 from core import factories
-from houses.models import House, Roommate, Bill, Payment, PaymentEvent
+from houses.models import House, Roommate, Bill, Payment, PaymentEvent, RecurringBill, RoommateBalance
+from houses.splits import WeightedSplit
 
 fake = Faker()
 
@@ -43,6 +55,36 @@ class CreateSplitPaymentsTest(BillDataMixin, TestCase):
             self.assertEqual(payment.amount, 16.00)
 
 
+class CreateUnevenSplitPaymentsTest(BillDataMixin, TestCase):
+    def setUp(self):
+        self.bill.amount = Decimal('10.00')
+        self.bill.save()
+
+    def test_no_cent_is_lost(self):
+        self.bill.create_split_payments()
+        amounts = sorted(Payment.objects.values_list('amount', flat=True))
+        self.assertEqual(amounts, [Decimal('2.50')] * 4)
+
+    def test_weighted_split(self):
+        roommate_ids = list(self.house.roommate_set.order_by('id').values_list('id', flat=True))
+        self.bill.create_split_payments(WeightedSplit({roommate_ids[0]: 2, roommate_ids[1]: 1}))
+        amounts = dict(Payment.objects.values_list('payer_id', 'amount'))
+        self.assertEqual(amounts[roommate_ids[0]], Decimal('6.67'))
+        self.assertEqual(amounts[roommate_ids[1]], Decimal('3.33'))
+        self.assertEqual(sum(amounts.values()), Decimal('10.00'))
+
+    def test_query_count_does_not_grow_with_roommates(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.bill.create_split_payments()
+        Payment.objects.all().delete()
+        RoommateBalance.objects.all().delete()
+        for i in range(10):
+            Roommate.objects.create(name=fake.first_name(), house=self.house)
+        with self.assertNumQueries(len(queries)):
+            self.bill.create_split_payments()
+        self.assertEqual(Payment.objects.count(), 14)
+
+
 class BillAmountDueTest(BillDataMixin, TestCase):
     def setUp(self):
         self.bill.create_split_payments()
@@ -55,6 +97,31 @@ class BillAmountDueTest(BillDataMixin, TestCase):
         self.assertEqual(amount_due, 48.00)
 
 
+class BillWithTotalsTest(BillDataMixin, TestCase):
+    def setUp(self):
+        self.bill.create_split_payments()
+        payment = self.bill.payment_set.first()
+        payment.amount_paid = 16.00
+        payment.save()
+        Bill.objects.create(
+            name='Water',
+            amount=20.00,
+            owner=self.bill.owner,
+            house=self.house,
+        )
+
+    def test_totals_are_annotated(self):
+        bill = Bill.objects.with_totals().get(id=self.bill.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(bill.amount_paid, 16.00)
+            self.assertEqual(bill.amount_due, 48.00)
+
+    def test_bill_without_payments(self):
+        bill = Bill.objects.with_totals().get(name='Water')
+        self.assertEqual(bill.amount_paid, 0)
+        self.assertEqual(bill.amount_due, 20.00)
+
+
 class BillAmountPaidTest(BillDataMixin, TestCase):
     def setUp(self):
         self.bill.create_split_payments()
@@ -89,6 +156,13 @@ class CreatePaymentEvent(BillDataMixin, TestCase):
             Decimal(self.payment_amount) - Decimal(self.payment_event_amount),
         )
 
+    def test_payment_is_not_read_back_after_commit(self):
+        # Insert, house lookup for the cache, payment update and read, and
+        # ledger read and update
+        with self.assertNumQueries(6):
+            PaymentEvent.objects.create(payment=self.payment, amount=1.00)
+        self.assertEqual(self.payment.amount_paid, Payment.objects.get(id=self.payment.id).amount_paid)
+
 
 class RoommatePaymentHistory(TestCase):
     @classmethod
@@ -240,3 +314,311 @@ class AmountsOwedToRoommates(TestCase):
             self.amounts_owed_to_roommates[0]['amount'],
             150.00,
         )
+
+
+class HouseBalanceMatrix(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = factories.create_fake_user()
+        cls.house = House.objects.create(
+            creator=cls.user,
+            name=fake.address(),
+        )
+        cls.r1 = Roommate.objects.create(name=fake.first_name(), house=cls.house)
+        cls.r2 = Roommate.objects.create(name=fake.first_name(), house=cls.house)
+        cls.r3 = Roommate.objects.create(name=fake.first_name(), house=cls.house)
+        b1 = Bill.objects.create(
+            name='Internet',
+            amount=90.00,
+            owner=cls.r1,
+            house=cls.house,
+        )
+        b2 = Bill.objects.create(
+            name='Heat',
+            amount=60.00,
+            owner=cls.r2,
+            house=cls.house,
+        )
+        for roommate in [cls.r1, cls.r2, cls.r3]:
+            Payment.objects.create(bill=b1, amount=30.00, payer=roommate)
+            Payment.objects.create(bill=b2, amount=20.00, payer=roommate)
+        Payment.objects.filter(bill=b1, payer=cls.r3).update(amount_paid=10.00)
+
+    def test_pairs(self):
+        balances = self.house.balance_matrix()
+        self.assertEqual(balances[(self.r2.id, self.r1.id)], 30.00)
+        self.assertEqual(balances[(self.r3.id, self.r1.id)], 20.00)
+        self.assertEqual(balances[(self.r1.id, self.r2.id)], 20.00)
+        self.assertEqual(balances[(self.r3.id, self.r2.id)], 20.00)
+
+    def test_roommates_do_not_owe_themselves(self):
+        balances = self.house.balance_matrix()
+        self.assertNotIn((self.r1.id, self.r1.id), balances)
+        self.assertNotIn((self.r2.id, self.r2.id), balances)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            self.house.balance_matrix()
+
+    def test_query_count_does_not_grow_with_roommates(self):
+        balances = self.house.balance_matrix()
+        with self.assertNumQueries(1):
+            self.r1.amounts_owed_from_roommates(balances)
+        for i in range(5):
+            Roommate.objects.create(name=fake.first_name(), house=self.house)
+        with self.assertNumQueries(1):
+            self.r1.amounts_owed_from_roommates(balances)
+
+
+class RoommateBalanceLedger(BillDataMixin, TestCase):
+    def setUp(self):
+        self.bill.create_split_payments()
+        self.owner = self.bill.owner
+
+    def test_split_adds_debts_to_owner(self):
+        balances = RoommateBalance.objects.filter(creditor=self.owner)
+        self.assertEqual(balances.count(), 3)
+        for balance in balances:
+            self.assertEqual(balance.amount, 16.00)
+
+    def test_owner_does_not_owe_themselves(self):
+        self.assertFalse(RoommateBalance.objects.filter(debtor=self.owner).exists())
+
+    def test_payment_event_reduces_debt(self):
+        payment = self.bill.payment_set.exclude(payer=self.owner).first()
+        PaymentEvent.objects.create(payment=payment, amount=6.00)
+        balance = RoommateBalance.objects.get(debtor=payment.payer, creditor=self.owner)
+        self.assertEqual(balance.amount, 10.00)
+
+    def test_second_bill_adds_to_existing_balances(self):
+        bill = Bill.objects.create(
+            name='Water',
+            amount=20.00,
+            owner=self.owner,
+            house=self.house,
+        )
+        bill.create_split_payments()
+        self.assertEqual(RoommateBalance.objects.count(), 3)
+        for balance in RoommateBalance.objects.all():
+            self.assertEqual(balance.amount, 21.00)
+
+    def test_ledger_matches_rebuild(self):
+        payment = self.bill.payment_set.exclude(payer=self.owner).first()
+        PaymentEvent.objects.create(payment=payment, amount=6.00)
+        ledger = set(RoommateBalance.objects.values_list('debtor_id', 'creditor_id', 'amount'))
+        RoommateBalance.objects.rebuild(self.house)
+        rebuilt = set(RoommateBalance.objects.values_list('debtor_id', 'creditor_id', 'amount'))
+        self.assertEqual(ledger, rebuilt)
+
+    def test_deleting_a_payment_removes_what_is_owed(self):
+        payment = self.bill.payment_set.exclude(payer=self.owner).first()
+        PaymentEvent.objects.create(payment=payment, amount=6.00)
+        payment.delete()
+        balance = RoommateBalance.objects.get(debtor=payment.payer, creditor=self.owner)
+        self.assertEqual(balance.amount, 0)
+
+    def test_deleting_a_bill_removes_its_debts(self):
+        Bill.objects.get(id=self.bill.id).delete()
+        self.assertEqual(set(RoommateBalance.objects.values_list('amount', flat=True)), {0})
+
+    def test_new_owner_takes_over_the_debts(self):
+        payment = self.bill.payment_set.exclude(payer=self.owner).first()
+        PaymentEvent.objects.create(payment=payment, amount=6.00)
+        bill = Bill.objects.get(id=self.bill.id)
+        bill.owner = payment.payer
+        bill.save()
+        self.assertFalse(RoommateBalance.objects.filter(creditor=self.owner).exclude(amount=0).exists())
+        self.assertEqual(RoommateBalance.objects.get(debtor=self.owner, creditor=payment.payer).amount, 16.00)
+        ledger = set(RoommateBalance.objects.exclude(amount=0).values_list('debtor_id', 'creditor_id', 'amount'))
+        RoommateBalance.objects.rebuild(self.house)
+        rebuilt = set(RoommateBalance.objects.exclude(amount=0).values_list('debtor_id', 'creditor_id', 'amount'))
+        self.assertEqual(ledger, rebuilt)
+
+    def test_payments_saved_one_at_a_time_are_posted(self):
+        payer = self.house.roommate_set.exclude(id=self.owner.id).first()
+        payment = Payment.objects.create(bill=self.bill, payer=payer, amount=Decimal('5.00'))
+        balance = RoommateBalance.objects.get(debtor=payer, creditor=self.owner)
+        self.assertEqual(balance.amount, Decimal('21.00'))
+
+        payment.amount = Decimal('2.50')
+        payment.save()
+        balance.refresh_from_db()
+        self.assertEqual(balance.amount, Decimal('18.50'))
+
+    def test_backfill_migration_matches_rebuild(self):
+        payment = self.bill.payment_set.exclude(payer=self.owner).first()
+        PaymentEvent.objects.create(payment=payment, amount=6.00)
+        RoommateBalance.objects.rebuild(self.house)
+        rebuilt = set(RoommateBalance.objects.values_list('house_id', 'debtor_id', 'creditor_id', 'amount'))
+        RoommateBalance.objects.all().delete()
+        backfill = import_module('houses.migrations.0007_backfill_roommate_balances')
+        backfill.rebuild_balances(apps, SimpleNamespace(connection=connection))
+        ledger = set(RoommateBalance.objects.values_list('house_id', 'debtor_id', 'creditor_id', 'amount'))
+        self.assertEqual(ledger, rebuilt)
+
+
+class InterleavedPaymentEvents(BillDataMixin, TestCase):
+    # The same race as ConcurrentPaymentEvents, without threads: another
+    # payment is posted after this one read the row and before it writes
+    def setUp(self):
+        self.bill.create_split_payments()
+        self.payment = self.bill.payment_set.exclude(payer=self.bill.owner).first()
+        pre_save.connect(self.post_concurrent_payment, sender=PaymentEvent)
+        self.addCleanup(pre_save.disconnect, self.post_concurrent_payment, sender=PaymentEvent)
+
+    def post_concurrent_payment(self, sender, instance, **kwargs):
+        Payment.objects.filter(id=self.payment.id).update(amount_paid=F('amount_paid') + Decimal('5.00'))
+
+    def test_no_payment_is_lost(self):
+        payment = Payment.objects.get(id=self.payment.id)
+        PaymentEvent.objects.create(payment=payment, amount=Decimal('8.00'))
+        self.assertEqual(Payment.objects.get(id=self.payment.id).amount_paid, Decimal('13.00'))
+        self.assertEqual(payment.amount_paid, Decimal('13.00'))
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentPaymentEvents(TransactionTestCase):
+    def setUp(self):
+        house = House.objects.create(
+            creator=factories.create_fake_user(),
+            name=fake.address(),
+        )
+        for i in range(2):
+            Roommate.objects.create(name=fake.first_name(), house=house)
+        self.bill = Bill.objects.create(
+            name='Rent',
+            amount=400.00,
+            owner=Roommate.objects.first(),
+            house=house,
+        )
+        self.bill.create_split_payments()
+        self.payment = self.bill.payment_set.exclude(payer=self.bill.owner).get()
+
+    def post_payments(self, count):
+        try:
+            for i in range(count):
+                PaymentEvent.objects.create(payment_id=self.payment.id, amount=1.00)
+        finally:
+            connection.close()
+
+    def test_no_payment_is_lost(self):
+        threads = [
+            threading.Thread(target=self.post_payments, args=(10,))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.payment.refresh_from_db()
+        self.assertEqual(PaymentEvent.objects.count(), 80)
+        self.assertEqual(self.payment.amount_paid, 80.00)
+        balance = RoommateBalance.objects.get(debtor=self.payment.payer)
+        self.assertEqual(balance.amount, 120.00)
+
+
+class FactoriesTest(TestCase):
+    def test_payment_event_factory(self):
+        event = factories.PaymentEventFactory()
+        payment = event.payment
+        self.assertEqual(payment.payer.house_id, payment.bill.house_id)
+        self.assertEqual(payment.amount_paid, 1.00)
+
+    def test_bulk_create_batch(self):
+        house = factories.HouseFactory()
+        roommates = factories.bulk_create_batch(factories.RoommateFactory, 25, batch_size=10, house=house)
+        self.assertEqual(house.roommate_set.count(), 25)
+        self.assertEqual(
+            [roommate.id for roommate in roommates],
+            list(house.roommate_set.order_by('id').values_list('id', flat=True)),
+        )
+
+
+class RoommatePaymentHistoryPages(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = factories.PaymentEventFactory()
+        cls.payment = cls.event.payment
+        for i in range(4):
+            factories.PaymentEventFactory(payment=cls.payment)
+        # two events sharing a timestamp are told apart by id
+        PaymentEvent.objects.filter(id=cls.event.id + 1).update(created=cls.event.created)
+        cls.roommate = cls.payment.payer
+
+    def test_pages_cover_history_once(self):
+        expected = list(self.roommate.payment_history().values_list('id', flat=True))
+        seen = []
+        cursor = None
+        while True:
+            page = list(self.roommate.payment_history(cursor)[:2])
+            if not page:
+                break
+            seen.extend(event.id for event in page)
+            cursor = (page[-1].created, page[-1].id)
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), 5)
+
+    def test_descriptions_need_no_extra_queries(self):
+        history = list(self.roommate.payment_history())
+        with self.assertNumQueries(0):
+            for event in history:
+                str(event)
+
+
+class RecurringBillBuildBill(BillDataMixin, TestCase):
+    def setUp(self):
+        self.template = RecurringBill(
+            name='Rent',
+            amount=Decimal('40.00'),
+            owner=self.bill.owner,
+            house=self.house,
+            day_of_month=31,
+        )
+
+    def test_due_date_falls_in_period(self):
+        bill = self.template.build_bill(date(2026, 2, 1))
+        self.assertEqual(bill.due_date.date(), date(2026, 2, 28))
+        self.assertEqual(bill.period, date(2026, 2, 1))
+
+    def test_bills_are_created_with_payments(self):
+        self.template.save()
+        bills = RecurringBill.objects.all().create_bills(date(2026, 3, 1))
+        self.assertEqual(len(bills), 1)
+        self.assertEqual(Payment.objects.filter(bill_id=bills[0].id).count(), 4)
+        self.assertFalse(RecurringBill.objects.due(date(2026, 3, 1)).exists())
+        self.assertTrue(RecurringBill.objects.due(date(2026, 4, 1)).exists())
+
+
+class OverduePayments(BillDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.bill.due_date = timezone.now() - timedelta(days=1)
+        cls.bill.save()
+        cls.bill.create_split_payments()
+        Bill.objects.create(
+            name='Water',
+            amount=8.00,
+            owner=cls.bill.owner,
+            house=cls.house,
+            due_date=timezone.now() + timedelta(days=1),
+        ).create_split_payments()
+        cls.paid = cls.bill.payment_set.last()
+        PaymentEvent.objects.create(payment=cls.paid, amount=16.00)
+
+    def test_unpaid_payments_past_due_are_listed(self):
+        overdue = Payment.objects.overdue()
+        # 4 roommates, less the one who paid and the owner
+        self.assertEqual(len(overdue), 2)
+        self.assertNotIn(self.paid, overdue)
+        self.assertTrue(all(payment.bill_id == self.bill.id for payment in overdue))
+
+    def test_owner_does_not_owe_themselves(self):
+        self.assertTrue(self.bill.payment_set.filter(payer=self.bill.owner).exists())
+        self.assertNotIn(self.bill.owner_id, [payment.payer_id for payment in Payment.objects.overdue()])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Checks the SQLite catalog')
+    def test_unpaid_index_exists(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'houses_payment_unpaid_idx'")
+            self.assertIn('WHERE amount_paid < amount', cursor.fetchone()[0])
@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from houses.settlements import net_positions, plan_transfers
+
+
+class NetPositionsTest(SimpleTestCase):
+    def test_positions(self):
+        positions = net_positions({
+            (1, 2): Decimal('10.00'),
+            (2, 3): Decimal('4.00'),
+            (3, 1): Decimal('1.00'),
+        })
+        self.assertEqual(positions, {1: Decimal('-9.00'), 2: Decimal('6.00'), 3: Decimal('3.00')})
+
+
+class PlanTransfersTest(SimpleTestCase):
+    def test_chain_is_collapsed(self):
+        # 1 owes 2, 2 owes 3: 1 can pay 3 directly
+        transfers = plan_transfers(net_positions({
+            (1, 2): Decimal('5.00'),
+            (2, 3): Decimal('5.00'),
+        }))
+        self.assertEqual(transfers, [(1, 3, Decimal('5.00'))])
+
+    def test_positions_are_settled(self):
+        positions = net_positions({
+            (1, 2): Decimal('12.00'),
+            (1, 3): Decimal('3.50'),
+            (4, 2): Decimal('7.25'),
+            (3, 4): Decimal('1.75'),
+            (2, 5): Decimal('2.00'),
+        })
+        transfers = plan_transfers(positions)
+        self.assertLess(len(transfers), len(positions))
+        for debtor_id, creditor_id, amount in transfers:
+            positions[debtor_id] += amount
+            positions[creditor_id] -= amount
+        self.assertEqual(set(positions.values()), {0})
+
+    def test_nothing_owed(self):
+        self.assertEqual(plan_transfers({1: 0, 2: 0}), [])
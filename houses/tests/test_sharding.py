@@ -0,0 +1,251 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from faker import Faker
+
+from django.contrib import admin
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.http.response import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core import factories
+from houses.models import House, Roommate, Bill, Payment, PaymentEvent, RoommateBalance
+from houses.sharding import SHARDED_MODELS, id_range, move_house, plan_moves, use_shard
+
+fake = Faker()
+
+SHARDS = ['shard1', 'shard2']
+
+
+@override_settings(DATABASE_SHARDS=SHARDS, SHARD_ID_SPAN=1000)
+class ShardedTestCase(TransactionTestCase):
+    # Two SQLite files stand in for the shard databases
+    multi_db = True
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_dir = tempfile.mkdtemp()
+        for alias in SHARDS:
+            connections.databases[alias] = dict(
+                connections.databases['default'],
+                NAME=os.path.join(cls.shard_dir, '{}.sqlite3'.format(alias)),
+                TEST={},
+            )
+        super().setUpClass()
+        for alias in SHARDS:
+            call_command('migrate', database=alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        shutil.rmtree(cls.shard_dir)
+
+    def setUp(self):
+        self.user = factories.create_fake_user()
+        self.client.force_login(self.user)
+
+    def create_house(self):
+        house = House.objects.create(creator=self.user, name=fake.address())
+        owner = house.roommate_set.create(name=fake.first_name())
+        house.roommate_set.create(name=fake.first_name())
+        bill = house.bill_set.create(name='Internet', amount=Decimal('40.00'), owner=owner)
+        bill.create_split_payments()
+        return house, bill
+
+
+class HouseShardRouting(ShardedTestCase):
+    def test_houses_are_spread_over_shards(self):
+        first, _ = self.create_house()
+        second, _ = self.create_house()
+        self.assertEqual({first.shard, second.shard}, set(SHARDS))
+
+    def test_house_data_lives_on_its_shard(self):
+        house, bill = self.create_house()
+        self.assertEqual(Bill.objects.using(house.shard).get().id, bill.id)
+        self.assertEqual(Payment.objects.using(house.shard).count(), 2)
+        self.assertEqual(RoommateBalance.objects.using(house.shard).count(), 1)
+        self.assertFalse(Roommate.objects.using('default').exists())
+
+    def test_ids_come_from_the_shard_block(self):
+        house, bill = self.create_house()
+        start, end = id_range(house.shard)
+        self.assertTrue(start < bill.id < end)
+
+    def test_use_shard_routes_model_queries(self):
+        house, bill = self.create_house()
+        with use_shard(house.shard):
+            self.assertEqual(Bill.objects.get().id, bill.id)
+
+    def test_deleting_a_house_deletes_its_data(self):
+        house, _ = self.create_house()
+        house.delete()
+        self.assertFalse(Roommate.objects.using(house.shard).exists())
+        self.assertFalse(Payment.objects.using(house.shard).exists())
+
+    def test_deleting_the_creator_deletes_house_data(self):
+        house, _ = self.create_house()
+        self.user.delete()
+        self.assertFalse(House.objects.exists())
+        self.assertFalse(Roommate.objects.using(house.shard).exists())
+        self.assertFalse(Payment.objects.using(house.shard).exists())
+
+
+class ShardedHouseViews(ShardedTestCase):
+    def test_user_pays_through_views(self):
+        house, bill = self.create_house()
+        payment = Payment.objects.using(house.shard).order_by('id').last()
+        response = self.client.post(
+            reverse('payment_event_create', args=(house.id, payment.id)),
+            data={'amount': 8.00},
+        )
+        self.assertRedirects(response, reverse('bill_detail', args=(house.id, bill.id)))
+        self.assertEqual(PaymentEvent.objects.using(house.shard).count(), 1)
+
+        response = self.client.get(reverse('bill_detail', args=(house.id, bill.id)))
+        self.assertEqual(response.status_code, HttpResponse.status_code)
+        self.assertEqual(response.context['object'].amount_paid, Decimal('8.00'))
+
+    def test_user_sees_overdue_payments_on_every_shard(self):
+        houses = [self.create_house() for i in range(2)]
+        Bill.objects.using('shard1').update(due_date=timezone.now() - timedelta(days=2))
+        Bill.objects.using('shard2').update(due_date=timezone.now() - timedelta(days=1))
+        response = self.client.get(reverse('user_overdue'))
+        # One roommate besides the owner in each house
+        self.assertEqual(len(response.context['object_list']), 2)
+        self.assertEqual(
+            [payment.bill_id for payment in response.context['object_list']],
+            sorted(bill.id for house, bill in houses),
+        )
+
+    def test_writes_are_refused_while_moving(self):
+        house, bill = self.create_house()
+        House.objects.filter(id=house.id).update(moving_to='shard1')
+        response = self.client.post(
+            reverse('roommate_create', args=(house.id,)),
+            data={'name': fake.first_name()},
+        )
+        self.assertEqual(response.status_code, 503)
+
+    def test_admin_writes_are_refused_while_moving(self):
+        house, bill = self.create_house()
+        House.objects.filter(id=house.id).update(moving_to='shard1')
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        response = self.client.post(reverse('admin:houses_house_change', args=(house.id,)), data={
+            'name': fake.address(),
+            'creator': self.user.id,
+            'shard': house.shard,
+            'moving_to': 'shard1',
+        })
+        self.assertEqual(response.status_code, 403)
+
+
+class HouseShardAdminActions(SimpleTestCase):
+    def get_actions(self):
+        return admin.site._registry[Bill].get_actions(RequestFactory().get('/'))
+
+    def test_bulk_delete_is_kept_without_shards(self):
+        self.assertIn('delete_selected', self.get_actions())
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_bulk_delete_is_left_out_with_shards(self):
+        self.assertNotIn('delete_selected', self.get_actions())
+
+
+class ShardedHouseCommands(ShardedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.house, self.bill = self.create_house()
+        House.objects.filter(id=self.house.id).update(moving_to='shard1')
+
+    def test_recurring_bills_skip_houses_being_moved(self):
+        moving = self.house.recurringbill_set.create(name='Rent', amount=Decimal('50.00'), owner=self.bill.owner)
+        other, bill = self.create_house()
+        other.recurringbill_set.create(name='Rent', amount=Decimal('50.00'), owner=bill.owner)
+        err = StringIO()
+        call_command('generate_recurring_bills', period='2026-10', stdout=StringIO(), stderr=err)
+        self.assertIn('Skipped recurring bills {}: house being moved'.format(moving.id), err.getvalue())
+        self.assertFalse(moving.bills.exists())
+        self.assertEqual(Bill.objects.using(other.shard).filter(period='2026-10-01').count(), 1)
+
+    def test_imports_are_refused_while_moving(self):
+        with self.assertRaises(CommandError):
+            call_command('import_ledger', self.house.id, '-', stdout=StringIO())
+
+
+class MoveHouse(ShardedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.house, self.bill = self.create_house()
+        self.source = self.house.shard
+        self.target = next(alias for alias in SHARDS if alias != self.source)
+        self.created = Bill.objects.using(self.source).get().created
+
+    def test_rows_are_moved_with_their_ids(self):
+        moved = move_house(self.house, self.target)
+        # 2 roommates, 1 bill, 2 payments and 1 balance
+        self.assertEqual(moved, 6)
+        bill = Bill.objects.using(self.target).get()
+        self.assertEqual(bill.id, self.bill.id)
+        self.assertEqual(bill.created, self.created)
+        self.assertFalse(Roommate.objects.using(self.source).exists())
+        self.assertEqual(House.objects.get(id=self.house.id).shard, self.target)
+        self.assertEqual(House.objects.get(id=self.house.id).moving_to, '')
+
+    def test_new_rows_use_the_target_block(self):
+        move_house(self.house, self.target)
+        roommate = self.house.roommate_set.create(name=fake.first_name())
+        start, end = id_range(self.target)
+        self.assertTrue(start < roommate.id < end)
+
+    def test_new_rows_on_default_stay_out_of_shard_blocks(self):
+        move_house(self.house, 'default')
+        roommate = self.house.roommate_set.create(name=fake.first_name())
+        bill = self.house.bill_set.create(name='Water', amount=Decimal('9.00'), owner=roommate)
+        payments = bill.create_split_payments()
+        end = id_range('default')[1]
+        self.assertLess(roommate.id, end)
+        self.assertLess(bill.id, end)
+        self.assertLess(max(payment.id for payment in payments), end)
+        self.assertEqual(Roommate.objects.using('default').filter(house=self.house).count(), 3)
+
+    def test_source_is_cleared_without_loading_rows(self):
+        for i in range(3):
+            bill = self.house.bill_set.create(name='Water', amount=Decimal('9.00'), owner=self.bill.owner)
+            bill.create_split_payments()
+        with CaptureQueriesContext(connections[self.source]) as queries:
+            move_house(self.house, self.target)
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), len(SHARDED_MODELS))
+        self.assertFalse(Payment.objects.using(self.source).exists())
+
+    def test_rebalance_command_moves_a_house(self):
+        call_command('rebalance_shards', house=self.house.id, to=self.target, stdout=StringIO())
+        self.assertEqual(House.objects.get(id=self.house.id).shard, self.target)
+        self.assertEqual(Payment.objects.using(self.target).count(), 2)
+
+
+class PlanMoves(SimpleTestCase):
+    def test_largest_house_that_narrows_the_gap_is_moved(self):
+        houses = {1: ('shard1', 10), 2: ('shard1', 4), 3: ('shard1', 3), 4: ('shard2', 1)}
+        self.assertEqual(plan_moves(houses, SHARDS), [(1, 'shard1', 'shard2'), (4, 'shard2', 'shard1')])
+
+    def test_balanced_shards_need_no_moves(self):
+        houses = {1: ('shard1', 5), 2: ('shard2', 5)}
+        self.assertEqual(plan_moves(houses, SHARDS), [])
+
+    def test_houses_as_large_as_the_gap_stay(self):
+        houses = {1: ('shard1', 2), 2: ('shard1', 2)}
+        self.assertEqual(plan_moves(houses, SHARDS + ['shard3']), [(2, 'shard1', 'shard2')])
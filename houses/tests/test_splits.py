@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from houses.splits import allocate, EqualSplit, WeightedSplit, PercentageSplit, FixedSplit
+
+
+class AllocateTest(SimpleTestCase):
+    def test_leftover_cents_go_to_largest_remainders(self):
+        shares = allocate(Decimal('10.00'), {1: 1, 2: 1, 3: 1})
+        self.assertEqual(list(shares.values()), [Decimal('3.34'), Decimal('3.33'), Decimal('3.33')])
+
+    def test_shares_add_up_to_total(self):
+        shares = allocate(Decimal('100.01'), {1: 3, 2: 5, 3: 7, 4: 11})
+        self.assertEqual(sum(shares.values()), Decimal('100.01'))
+
+    def test_zero_weights(self):
+        with self.assertRaises(ValueError):
+            allocate(Decimal('10.00'), {1: 0})
+
+
+class EqualSplitTest(SimpleTestCase):
+    def test_split(self):
+        shares = EqualSplit().split(Decimal('64.00'), [1, 2, 3, 4])
+        self.assertEqual(set(shares.values()), {Decimal('16.00')})
+
+
+class WeightedSplitTest(SimpleTestCase):
+    def test_split(self):
+        shares = WeightedSplit({1: 2, 2: 1}).split(Decimal('10.00'), [1, 2, 3])
+        self.assertEqual(shares, {1: Decimal('6.67'), 2: Decimal('3.33'), 3: Decimal('0.00')})
+
+
+class PercentageSplitTest(SimpleTestCase):
+    def test_split(self):
+        shares = PercentageSplit({1: 50, 2: 25, 3: 25}).split(Decimal('99.99'), [1, 2, 3])
+        self.assertEqual(shares, {1: Decimal('49.99'), 2: Decimal('25.00'), 3: Decimal('25.00')})
+
+    def test_percentages_must_add_up(self):
+        with self.assertRaises(ValueError):
+            PercentageSplit({1: 50, 2: 25}).split(Decimal('10.00'), [1, 2])
+
+
+class FixedSplitTest(SimpleTestCase):
+    def test_rest_is_split_equally(self):
+        shares = FixedSplit({1: '4.00'}).split(Decimal('10.00'), [1, 2, 3, 4])
+        self.assertEqual(shares, {
+            1: Decimal('4.00'),
+            2: Decimal('2.00'),
+            3: Decimal('2.00'),
+            4: Decimal('2.00'),
+        })
+
+    def test_fixed_amounts_over_total(self):
+        with self.assertRaises(ValueError):
+            FixedSplit({1: '40.00'}).split(Decimal('10.00'), [1, 2])
@@ -1,11 +1,23 @@
+import csv
+import io
+from datetime import timedelta
+from unittest import mock
+
 from faker import Faker
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.http.response import HttpResponseRedirect, HttpResponse
 
 from core import factories
 
+from houses.cache import get_house_version
 from houses.models import House, Roommate, Bill, Payment, PaymentEvent
 
 fake = Faker()
@@ -113,6 +125,162 @@ class UserVisitsHouse(HouseDataMixin, TestCase):
         self.assertEqual(self.response.status_code, HttpResponse.status_code)
 
 
+class UserVisitsHouseWithBills(HouseDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.roommate = Roommate.objects.create(name=fake.first_name(), house=cls.house)
+        Roommate.objects.create(name=fake.first_name(), house=cls.house)
+
+    def create_bill(self):
+        bill = Bill.objects.create(
+            name=fake.word(),
+            amount=30.00,
+            owner=self.roommate,
+            house=self.house,
+        )
+        bill.create_split_payments()
+
+    def get_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('house_detail', args=(self.house.id,)))
+        return len(queries)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        # Load the session and user into the cache before counting
+        self.client.get(reverse('house_list'))
+
+    def test_query_count_does_not_grow_with_bills(self):
+        self.create_bill()
+        query_count = self.get_query_count()
+        for i in range(5):
+            self.create_bill()
+        self.assertEqual(self.get_query_count(), query_count)
+
+    def test_bill_totals_are_listed(self):
+        self.create_bill()
+        response = self.client.get(reverse('house_detail', args=(self.house.id,)))
+        bill = response.context['bills'][0]
+        self.assertEqual(bill.amount_due, 30.00)
+        self.assertEqual(bill.amount_paid, 0)
+
+
+# What production gets with a shared CACHE_BACKEND
+@override_settings(CACHES=dict(settings.CACHES, house_fragments=settings.CACHES['default']))
+class HouseFragmentCache(HouseDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.roommate = Roommate.objects.create(name=fake.first_name(), house=cls.house)
+        Roommate.objects.create(name=fake.first_name(), house=cls.house)
+        cls.bill = Bill.objects.create(
+            name='Heat',
+            amount=30.00,
+            owner=cls.roommate,
+            house=cls.house,
+        )
+        cls.bill.create_split_payments()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse('house_detail', args=(self.house.id,))
+        self.client.get(self.url)
+
+    def test_fragments_are_cached(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertNotIn('houses_bill', ' '.join(query['sql'] for query in queries))
+        self.assertContains(response, '&dollar;30.00 Due')
+
+    def test_payment_event_invalidates_bills(self):
+        payment = self.bill.payment_set.exclude(payer=self.roommate).get()
+        PaymentEvent.objects.create(payment=payment, amount=5.00)
+        self.assertContains(self.client.get(self.url), '&dollar;25.00 Due')
+
+    def test_new_bill_invalidates_bills(self):
+        bill = Bill.objects.create(
+            name='Water',
+            amount=12.00,
+            owner=self.roommate,
+            house=self.house,
+        )
+        bill.create_split_payments()
+        self.assertContains(self.client.get(self.url), 'Water')
+
+    def test_new_roommate_invalidates_roommates(self):
+        roommate = Roommate.objects.create(name='Zelda', house=self.house)
+        self.assertContains(self.client.get(self.url), roommate.name)
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_replica_renders_are_not_cached(self):
+        # The fragments the primary rendered in setUp are gone after this
+        Roommate.objects.create(name='Zelda', house=self.house)
+        replica_router = mock.Mock(db_for_read=mock.Mock(return_value='replica1'))
+        with mock.patch('houses.views.router', replica_router):
+            response = self.client.get(self.url)
+            self.assertEqual(response.context['fragment_cache'], 'house_fragments_replica')
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.url)
+        self.assertIn('houses_roommate', ' '.join(query['sql'] for query in queries))
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_replica_renders_read_cached_fragments(self):
+        replica_router = mock.Mock(db_for_read=mock.Mock(return_value='replica1'))
+        with mock.patch('houses.views.router', replica_router):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url)
+        self.assertNotIn('houses_bill', ' '.join(query['sql'] for query in queries))
+        self.assertContains(response, '&dollar;30.00 Due')
+
+    @override_settings(CACHES=settings.CACHES)
+    def test_fragments_are_not_cached_in_a_process_local_cache(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertIn('houses_bill', ' '.join(query['sql'] for query in queries))
+
+    def test_other_houses_are_not_invalidated(self):
+        version = get_house_version(self.house.id)
+        other_house = House.objects.create(name=fake.address(), creator=self.user)
+        Roommate.objects.create(name=fake.first_name(), house=other_house)
+        self.assertEqual(get_house_version(self.house.id), version)
+
+
+class HouseIsFetchedOnce(HouseDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_house_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data=data)
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT "houses_house"')]
+
+    def test_detail(self):
+        url = reverse('house_detail', args=(self.house.id,))
+        self.assertEqual(len(self.get_house_queries('get', url)), 1)
+
+    def test_update(self):
+        url = reverse('house_update', args=(self.house.id,))
+        self.assertEqual(len(self.get_house_queries('post', url, {'name': fake.address()})), 1)
+
+    def test_delete(self):
+        url = reverse('house_delete', args=(self.house.id,))
+        self.assertEqual(len(self.get_house_queries('get', url)), 1)
+
+
+class UserVisitsOtherUsersHouse(HouseDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(factories.UserFactory())
+        self.response = self.client.get(
+            reverse('house_detail', args=(self.house.id,))
+        )
+
+    def test_user_is_redirected(self):
+        self.assertEqual(self.response.status_code, HttpResponseRedirect.status_code)
+
+
 class AnonUserDeletesHouse(HouseDataMixin, TestCase):
     def setUp(self):
         self.response = self.client.post(
@@ -283,6 +451,33 @@ class UserCreatesBill(HouseDataMixin, TestCase):
             self.assertEqual(payment.amount, amount)
 
 
+class UserCreatesBillHouseLookups(HouseDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.roommate = Roommate.objects.create(name=fake.first_name(), house=cls.house)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_house_queries(self, method, data=None):
+        url = reverse('bill_create', args=(self.house.id,))
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data=data)
+        return [
+            query['sql'] for query in queries
+            if 'FROM "houses_house"' in query['sql'] or 'FROM "users_user"' in query['sql']
+        ]
+
+    def test_house_is_fetched_once_on_post(self):
+        data = {'name': 'Heat', 'amount': 10.00, 'owner': self.roommate.id}
+        # the session's user, then the house
+        self.assertEqual(len(self.get_house_queries('post', data)), 2)
+
+    def test_house_is_fetched_once_on_get(self):
+        self.assertEqual(len(self.get_house_queries('get')), 2)
+
+
 class UserViewsBill(HouseDataMixin, TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -308,6 +503,19 @@ class UserViewsBill(HouseDataMixin, TestCase):
         context_data = self.response.context_data
         self.assertEqual(len(context_data['payments']), 3)
 
+    def test_query_count_does_not_grow_with_payments(self):
+        bill = Bill.objects.first()
+        url = reverse('bill_detail', args=(self.house.id, bill.id,))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        Payment.objects.create(
+            bill=bill,
+            payer=Roommate.objects.create(name=fake.first_name(), house=self.house),
+            amount=1.00,
+        )
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url)
+
 
 class BillDataMixin(HouseDataMixin):
     @classmethod
@@ -330,7 +538,7 @@ class UserVisitsPaymentEventCreate(BillDataMixin, TestCase):
     def setUp(self):
         self.client.force_login(self.user)
         self.response = self.client.get(
-            reverse('payment_event_create', args=(self.payment.id,)),
+            reverse('payment_event_create', args=(self.house.id, self.payment.id)),
         )
 
     def test_user_can_view(self):
@@ -342,7 +550,7 @@ class UserCreatesPaymentEvent(BillDataMixin, TestCase):
         self.client.force_login(self.user)
         data = {'amount': 8.00}
         self.response = self.client.post(
-            reverse('payment_event_create', args=(self.payment.id,)),
+            reverse('payment_event_create', args=(self.house.id, self.payment.id)),
             data=data,
         )
 
@@ -356,12 +564,58 @@ class UserCreatesPaymentEvent(BillDataMixin, TestCase):
         self.assertEqual(payment.amount_paid, 8.00)
 
 
+class UserPaysOnOtherUsersHouse(BillDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(factories.UserFactory())
+        self.response = self.client.post(
+            reverse('payment_event_create', args=(self.house.id, self.payment.id)),
+            data={'amount': 8.00},
+        )
+
+    def test_user_is_redirected(self):
+        self.assertEqual(self.response.status_code, HttpResponseRedirect.status_code)
+
+    def test_payment_event_is_not_created(self):
+        self.assertEqual(PaymentEvent.objects.count(), 0)
+
+
+class UserFollowsOldPaymentLink(BillDataMixin, TestCase):
+    def test_user_is_redirected_to_the_house_url(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/houses/payments/{}/pay'.format(self.payment.id))
+        self.assertRedirects(
+            response,
+            reverse('payment_event_create', args=(self.house.id, self.payment.id)),
+            status_code=301,
+        )
+
+    def test_missing_payment(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/houses/payments/0/pay')
+        self.assertEqual(response.status_code, 404)
+
+
+class UserCreatesPaymentEventPaymentLookups(BillDataMixin, TestCase):
+    def test_payment_is_fetched_once(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(
+                reverse('payment_event_create', args=(self.house.id, self.payment.id)),
+                data={'amount': 8.00},
+            )
+        payment_queries = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT "houses_payment"."id", "houses_payment"."bill_id"')
+        ]
+        self.assertEqual(len(payment_queries), 1)
+
+
 class UserPaysMoreThanPaymentAmount(BillDataMixin, TestCase):
     def setUp(self):
         self.client.force_login(self.user)
         data = {'amount': 1000.00}
         self.response = self.client.post(
-            reverse('payment_event_create', args=(self.payment.id,)),
+            reverse('payment_event_create', args=(self.house.id, self.payment.id)),
             data=data,
         )
 
@@ -388,3 +642,174 @@ class RoommateDetailViewTests(BillDataMixin, TestCase):
 
     def test_response_is_successful(self):
         self.assertEqual(self.response.status_code, HttpResponse.status_code)
+
+
+class UserVisitsSettleUp(BillDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.response = self.client.get(reverse('settle_up', args=(self.house.id,)))
+
+    def test_user_can_view(self):
+        self.assertEqual(self.response.status_code, HttpResponse.status_code)
+
+    def test_transfers_pay_bill_owner(self):
+        transfers = self.response.context['transfers']
+        self.assertEqual(len(transfers), 3)
+        for transfer in transfers:
+            self.assertEqual(transfer['payee_id'], self.bill.owner_id)
+            self.assertEqual(transfer['amount'], 16.00)
+
+
+class UserFetchesSettleUpJSON(BillDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.response = self.client.get(reverse('settle_up_json', args=(self.house.id,)))
+
+    def test_transfers_are_listed(self):
+        data = self.response.json()
+        self.assertEqual(data['house_id'], self.house.id)
+        self.assertEqual(len(data['transfers']), 3)
+        self.assertEqual(data['transfers'][0]['amount'], '16.00')
+
+
+class AnonUserFetchesSettleUpJSON(BillDataMixin, TestCase):
+    def setUp(self):
+        self.response = self.client.get(reverse('settle_up_json', args=(self.house.id,)))
+
+    def test_user_is_redirected(self):
+        self.assertEqual(self.response.status_code, HttpResponseRedirect.status_code)
+
+
+class UserLoadsMorePaymentHistory(BillDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(25):
+            PaymentEvent.objects.create(payment=cls.payment, amount=0.50)
+        cls.roommate = cls.payment.payer
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.response = self.client.get(
+            reverse('roommate_detail', args=(self.house.id, self.roommate.id,))
+        )
+
+    def test_first_page_is_listed(self):
+        self.assertEqual(len(self.response.context['payment_history']), 20)
+        self.assertIsNotNone(self.response.context['next_cursor'])
+
+    def test_next_page_is_loaded(self):
+        response = self.client.get(
+            reverse('roommate_payment_history', args=(self.house.id, self.roommate.id,)),
+            {'cursor': self.response.context['next_cursor']},
+        )
+        self.assertEqual(len(response.context['payment_history']), 5)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            reverse('roommate_payment_history', args=(self.house.id, self.roommate.id,)),
+            {'cursor': 'nope'},
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_out_of_range_cursor(self):
+        response = self.client.get(
+            reverse('roommate_payment_history', args=(self.house.id, self.roommate.id,)),
+            {'cursor': '{}-1'.format(10 ** 30)},
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class UserExportsHouseLedger(BillDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        PaymentEvent.objects.create(payment=cls.payment, amount=4.00)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.response = self.client.get(reverse('house_ledger_export', args=(self.house.id,)))
+        self.rows = list(csv.reader(io.StringIO(b''.join(self.response.streaming_content).decode())))
+
+    def test_response_is_streamed_csv(self):
+        self.assertTrue(self.response.streaming)
+        self.assertEqual(self.response['Content-Type'], 'text/csv')
+
+    def test_every_ledger_row_is_exported(self):
+        types = [row[0] for row in self.rows[1:]]
+        self.assertEqual(types.count('bill'), 1)
+        self.assertEqual(types.count('payment'), 4)
+        self.assertEqual(types.count('payment_event'), 1)
+
+
+class UserExportsRoommateLedger(BillDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+        roommate = Roommate.objects.exclude(id=self.bill.owner_id).first()
+        response = self.client.get(reverse('roommate_ledger_export', args=(self.house.id, roommate.id)))
+        self.rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_only_roommates_payments_are_exported(self):
+        self.assertEqual([row[0] for row in self.rows[1:]], ['payment'])
+
+
+class AnonUserExportsHouseLedger(BillDataMixin, TestCase):
+    def setUp(self):
+        self.response = self.client.get(reverse('house_ledger_export', args=(self.house.id,)))
+
+    def test_user_is_redirected(self):
+        self.assertEqual(self.response.status_code, HttpResponseRedirect.status_code)
+
+
+class UserImportsLedger(BillDataMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+        owner = self.bill.owner
+        data = '\n'.join([
+            'type,id,created,bill_id,bill,payment_id,payer,payee,amount,amount_paid',
+            'bill,1,2016-01-01,1,Rent,,,{0},10.00,'.format(owner.name),
+            'payment,1,2016-01-01,1,Rent,1,{0},{0},10.00,0.00'.format(owner.name),
+            'payment,2,2016-01-01,9,Rent,2,{0},{0},10.00,0.00'.format(owner.name),
+        ])
+        upload = SimpleUploadedFile('ledger.csv', data.encode(), content_type='text/csv')
+        self.response = self.client.post(reverse('house_ledger_import', args=(self.house.id,)), {'file': upload})
+
+    def test_rows_are_imported(self):
+        self.assertTrue(Bill.objects.filter(house=self.house, name='Rent').exists())
+        report, = self.response.context['reports']
+        self.assertEqual((report.bills, report.payments), (1, 1))
+
+    def test_errors_are_reported(self):
+        self.assertContains(self.response, 'Line 4: Unknown bill 9')
+
+    def test_files_that_are_not_utf8_are_refused(self):
+        data = 'type,id,created,bill_id,bill,payment_id,payer,payee,amount,amount_paid\nbill,2,,2,Caf\xe9,,,,1.00,'
+        upload = SimpleUploadedFile('ledger.csv', data.encode('cp1252'), content_type='text/csv')
+        response = self.client.post(reverse('house_ledger_import', args=(self.house.id,)), {'file': upload})
+        self.assertContains(response, 'File is not UTF-8 encoded')
+        self.assertFalse(Bill.objects.filter(name__startswith='Caf').exists())
+
+
+class UserVisitsOverduePayments(BillDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Bill.objects.filter(id=cls.bill.id).update(due_date=timezone.now() - timedelta(days=3))
+        other = factories.HouseFactory()
+        bill = factories.BillFactory(house=other, owner__house=other, due_date=timezone.now() - timedelta(days=3))
+        bill.create_split_payments()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_house_overdue_payments_are_listed(self):
+        response = self.client.get(reverse('house_overdue', args=(self.house.id,)))
+        payments = response.context['object_list']
+        self.assertEqual(len(payments), 3)
+        self.assertNotIn(self.bill.owner_id, [payment.payer_id for payment in payments])
+
+    def test_users_overdue_payments_are_listed(self):
+        response = self.client.get(reverse('user_overdue'))
+        payments = response.context['object_list']
+        self.assertEqual({payment.bill.house_id for payment in payments}, {self.house.id})
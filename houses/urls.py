@@ -4,13 +4,22 @@ from . import views
 
 urlpatterns = [
     url(r'^$', views.HouseListView.as_view(), name='house_list'),
+    url(r'^overdue/$', views.UserOverdueView.as_view(), name='user_overdue'),
     url(r'^create', views.HouseCreateView.as_view(), name='house_create'),
     url(r'^(?P<pk>[0-9]+)/$', views.HouseDetailView.as_view(), name='house_detail'),
     url(r'^(?P<pk>[0-9]+)/delete', views.HouseDeleteView.as_view(), name='house_delete'),
     url(r'^(?P<pk>[0-9]+)/update', views.HouseUpdateView.as_view(), name='house_update'),
     url(r'^(?P<house_id>[0-9]+)/roommates/create', views.RoommateCreateView.as_view(), name='roommate_create'),
     url(r'^(?P<house_id>[0-9]+)/roommates/(?P<pk>[0-9]+)/$', views.RoommateDetailView.as_view(), name='roommate_detail'),
+    url(r'^(?P<house_id>[0-9]+)/roommates/(?P<pk>[0-9]+)/history/$', views.RoommatePaymentHistoryView.as_view(), name='roommate_payment_history'),
+    url(r'^(?P<house_id>[0-9]+)/roommates/(?P<pk>[0-9]+)/export\.csv$', views.RoommateLedgerExportView.as_view(), name='roommate_ledger_export'),
     url(r'^(?P<house_id>[0-9]+)/bills/create', views.BillCreateView.as_view(), name='bill_create'),
     url(r'^(?P<house_id>[0-9]+)/bills/(?P<pk>[0-9]+)/$', views.BillDetailView.as_view(), name='bill_detail'),
-    url(r'^payments/(?P<payment_id>[0-9]+)/pay', views.PaymentEventCreateView.as_view(), name='payment_event_create'),
+    url(r'^(?P<house_id>[0-9]+)/settle/$', views.SettleUpView.as_view(), name='settle_up'),
+    url(r'^(?P<house_id>[0-9]+)/settle\.json$', views.SettleUpJSONView.as_view(), name='settle_up_json'),
+    url(r'^(?P<house_id>[0-9]+)/overdue/$', views.HouseOverdueView.as_view(), name='house_overdue'),
+    url(r'^(?P<house_id>[0-9]+)/export\.csv$', views.HouseLedgerExportView.as_view(), name='house_ledger_export'),
+    url(r'^(?P<house_id>[0-9]+)/import/$', views.HouseLedgerImportView.as_view(), name='house_ledger_import'),
+    url(r'^(?P<house_id>[0-9]+)/payments/(?P<payment_id>[0-9]+)/pay', views.PaymentEventCreateView.as_view(), name='payment_event_create'),
+    url(r'^payments/(?P<payment_id>[0-9]+)/pay', views.PaymentRedirectView.as_view(), name='payment_redirect'),
 ]
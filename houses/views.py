@@ -5,20 +5,33 @@ from django.views.generic import (
     DeleteView,
     UpdateView,
 )
-from django.views.generic.base import TemplateView
+from django.views.generic.base import RedirectView, TemplateView, View
+from django.views.generic.edit import FormView
+from django.conf import settings
+from django.db import router
 from django.urls import reverse_lazy
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin
 
-from .models import House, Roommate, Bill, Payment, PaymentEvent
-from .mixins import CreatorCheckMixin, HouseChildrenMixin
-from .forms import PaymentEventForm
+from .models import House, Roommate, Bill, Payment, PaymentEvent, RoommateBalance
+from .mixins import CreatorCheckMixin, HouseChildrenMixin, HouseShardMixin, ReplicaReadMixin, SingleObjectCacheMixin
+from .cache import get_house_version
+from .exports import ledger_csv, ledger_rows
+from .forms import LedgerImportForm, PaymentEventForm
+from .imports import LedgerImporter
+from .pagination import decode_cursor, keyset_page
+from .settlements import plan_settlement
+from .sharding import houses_by_shard, shard_aliases, use_shard
+
+PAYMENT_HISTORY_PAGE_SIZE = 20
 
 
 class HomePageView(TemplateView):
     template_name = 'home.html'
 
 
-class HouseListView(LoginRequiredMixin, ListView):
+class HouseListView(ReplicaReadMixin, LoginRequiredMixin, ListView):
     model = House
     login_url = '/login/'
 
@@ -42,19 +55,31 @@ class HouseCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         self.object = form.save()
-        Roommate.objects.create(
-            name=self.request.user.username,
-            house=self.object
-        )
+        self.object.roommate_set.create(name=self.request.user.username)
         return super().form_valid(form)
 
 
-class HouseDetailView(CreatorCheckMixin, DetailView):
+class HouseDetailView(ReplicaReadMixin, HouseShardMixin, CreatorCheckMixin, DetailView):
     model = House
+    house_url_kwarg = 'pk'
+
+    def get_context_data(self, **kwargs):
+        context_data = super().get_context_data(**kwargs)
+        context_data['bills'] = self.object.bill_set.with_totals()
+        context_data['house_version'] = get_house_version(self.object.id)
+        context_data['fragment_cache_timeout'] = settings.HOUSE_FRAGMENT_CACHE_TIMEOUT
+        # The version is bumped once the primary commits, when a replica may
+        # not have the change yet
+        if router.db_for_read(Bill, instance=self.object) in settings.DATABASE_REPLICAS:
+            context_data['fragment_cache'] = 'house_fragments_replica'
+        else:
+            context_data['fragment_cache'] = 'house_fragments'
+        return context_data
 
 
-class HouseDeleteView(CreatorCheckMixin, DeleteView):
+class HouseDeleteView(HouseShardMixin, CreatorCheckMixin, DeleteView):
     model = House
+    house_url_kwarg = 'pk'
     success_url = reverse_lazy('house_list')
 
 
@@ -64,13 +89,12 @@ class HouseUpdateView(CreatorCheckMixin, UpdateView):
     template_name_suffix = '_update_form'
 
     def get_success_url(self):
-        obj = self.get_object()
-        return reverse_lazy('house_detail', args=(obj.id,))
+        return reverse_lazy('house_detail', args=(self.object.id,))
 
 
-class RoommateCreateView(HouseChildrenMixin, CreateView):
+class RoommateCreateView(HouseShardMixin, HouseChildrenMixin, CreateView):
     model = Roommate
-    fields = ['name', 'house']
+    fields = ['name']
     template_name_suffix = '_create_form'
 
     def get_context_data(self, **kwargs):
@@ -79,26 +103,25 @@ class RoommateCreateView(HouseChildrenMixin, CreateView):
         context_data['house_id'] = house.id
         return context_data
 
-    def post(self, request, *args, **kwargs):
-        post = request.POST.copy()
-        post['house'] = self.get_house().id
-        request.POST = post
-        return super().post(request, *args, **kwargs)
+    def form_valid(self, form):
+        form.instance.house = self.get_house()
+        return super().form_valid(form)
 
     def get_success_url(self):
         house = self.get_house()
         return reverse_lazy('house_detail', args=(house.id,))
 
 
-class BillCreateView(HouseChildrenMixin, CreateView):
+class BillCreateView(HouseShardMixin, HouseChildrenMixin, CreateView):
     model = Bill
-    fields = ['name', 'amount', 'owner', 'house']
+    fields = ['name', 'amount', 'owner']
     template_name_suffix = '_create_form'
 
     def form_valid(self, form):
+        form.instance.house = self.get_house()
         self.object = form.save()
         self.object.create_split_payments()
-        return super().form_valid(form)
+        return HttpResponseRedirect(self.get_success_url())
 
     def get_context_data(self, **kwargs):
         house = self.get_house()
@@ -108,64 +131,188 @@ class BillCreateView(HouseChildrenMixin, CreateView):
         context_data['roommates'] = roommates
         return context_data
 
-    def post(self, request, *args, **kwargs):
-        post = request.POST.copy()
-        post['house'] = self.get_house().id
-        request.POST = post
-        return super().post(request, *args, **kwargs)
-
     def get_success_url(self):
         house = self.get_house()
         return reverse_lazy('house_detail', args=(house.id,))
 
 
-class BillDetailView(HouseChildrenMixin, DetailView):
+class BillDetailView(ReplicaReadMixin, HouseShardMixin, HouseChildrenMixin, SingleObjectCacheMixin, DetailView):
     model = Bill
 
+    def get_queryset(self):
+        return super().get_queryset().with_totals().filter(house_id=self.kwargs.get('house_id'))
+
     def get_context_data(self, **kwargs):
         context_data = super().get_context_data(**kwargs)
-        payments = self.get_object().payment_set.all()
+        payments = self.object.payment_set.select_related('payer')
         context_data['payments'] = payments
         return context_data
 
 
-class PaymentEventCreateView(CreateView):
+class PaymentEventCreateView(HouseShardMixin, HouseChildrenMixin, CreateView):
     model = PaymentEvent
     form_class = PaymentEventForm
 
-    def post(self, request, *args, **kwargs):
-        post = request.POST.copy()
-        post['payment'] = self.get_payment().id
-        request.POST = post
-        return super().post(request, *args, **kwargs)
-
     def get_success_url(self):
         bill = self.get_payment().bill
-        return reverse_lazy('bill_detail', args=(bill.house.id, bill.id,))
+        return reverse_lazy('bill_detail', args=(bill.house_id, bill.id,))
 
     def get_payment(self):
-        payment_id = self.kwargs.get('payment_id')
-        return Payment.objects.get(id=payment_id)
+        if not hasattr(self, '_payment'):
+            self._payment = get_object_or_404(
+                Payment.objects.select_related('bill'),
+                id=self.kwargs.get('payment_id'),
+                bill__house_id=self.kwargs.get('house_id'),
+            )
+        return self._payment
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['payment'] = self.get_payment()
+        return kwargs
 
     def get_context_data(self, **kwargs):
         context_data = super().get_context_data(**kwargs)
         payment = self.get_payment()
         bill = payment.bill
-        house = bill.house
         context_data['payment_id'] = payment.id
         context_data['amount_due'] = payment.amount_due
         context_data['bill_id'] = bill.id
-        context_data['house_id'] = house.id
+        context_data['house_id'] = bill.house_id
+        return context_data
+
+
+class PaymentRedirectView(LoginRequiredMixin, RedirectView):
+    # Payment links from before they were nested under their house
+    permanent = True
+    pattern_name = 'payment_event_create'
+
+    def get_redirect_url(self, *args, **kwargs):
+        for alias in shard_aliases():
+            house_id = Payment.objects.using(alias).filter(
+                id=kwargs['payment_id'],
+            ).values_list('bill__house_id', flat=True).first()
+            if house_id is not None:
+                return super().get_redirect_url(house_id=house_id, payment_id=kwargs['payment_id'])
+        raise Http404('No payment matches the given query.')
+
+
+class RoommateDetailView(ReplicaReadMixin, HouseShardMixin, SingleObjectCacheMixin, DetailView):
+    model = Roommate
+
+    def get_queryset(self):
+        return super().get_queryset().filter(house_id=self.kwargs.get('house_id'))
+
+    def get_context_data(self, **kwargs):
+        context_data = super().get_context_data(**kwargs)
+        obj = self.object
+        balances = RoommateBalance.objects
+        context_data['payment_history'], context_data['next_cursor'] = keyset_page(
+            obj.payment_history(),
+            PAYMENT_HISTORY_PAGE_SIZE,
+        )
+        context_data['amounts_owed_from_roommates'] = balances.amounts_owed_from_roommates(obj)
+        context_data['amounts_owed_to_roommates'] = balances.amounts_owed_to_roommates(obj)
         return context_data
 
 
-class RoommateDetailView(DetailView):
+class RoommatePaymentHistoryView(HouseShardMixin, HouseChildrenMixin, SingleObjectCacheMixin, DetailView):
     model = Roommate
+    template_name_suffix = '_payment_history'
+
+    def get_queryset(self):
+        return super().get_queryset().filter(house_id=self.kwargs.get('house_id'))
+
+    def get_context_data(self, **kwargs):
+        context_data = super().get_context_data(**kwargs)
+        cursor = self.request.GET.get('cursor')
+        try:
+            cursor = decode_cursor(cursor) if cursor else None
+        except (ValueError, OverflowError):
+            raise Http404('Invalid cursor')
+        context_data['payment_history'], context_data['next_cursor'] = keyset_page(
+            self.object.payment_history(cursor),
+            PAYMENT_HISTORY_PAGE_SIZE,
+        )
+        return context_data
+
+
+class SettleUpView(HouseShardMixin, HouseChildrenMixin, TemplateView):
+    template_name = 'houses/settle_up.html'
+
+    def get_context_data(self, **kwargs):
+        context_data = super().get_context_data(**kwargs)
+        context_data['house_id'] = self.get_house().id
+        context_data['transfers'] = plan_settlement(self.get_house())
+        return context_data
+
+
+class SettleUpJSONView(SettleUpView):
+    def render_to_response(self, context, **response_kwargs):
+        transfers = [
+            dict(transfer, amount=str(transfer['amount']))
+            for transfer in context['transfers']
+        ]
+        return JsonResponse({'house_id': context['house_id'], 'transfers': transfers})
+
+
+class HouseLedgerExportView(HouseShardMixin, HouseChildrenMixin, View):
+    def get(self, request, *args, **kwargs):
+        house = self.get_house()
+        return self.stream(ledger_rows(house=house), 'house-{}-ledger.csv'.format(house.id))
+
+    def stream(self, rows, filename):
+        response = StreamingHttpResponse(ledger_csv(rows), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+        return response
+
+
+class RoommateLedgerExportView(HouseLedgerExportView):
+    def get(self, request, *args, **kwargs):
+        roommate = get_object_or_404(Roommate, id=kwargs['pk'], house_id=self.get_house().id)
+        return self.stream(ledger_rows(roommate=roommate), 'roommate-{}-ledger.csv'.format(roommate.id))
+
+
+class HouseLedgerImportView(HouseShardMixin, HouseChildrenMixin, FormView):
+    form_class = LedgerImportForm
+    template_name = 'houses/ledger_import.html'
+
+    def get_context_data(self, **kwargs):
+        context_data = super().get_context_data(**kwargs)
+        context_data['house_id'] = self.get_house().id
+        return context_data
+
+    def form_valid(self, form):
+        # Decode the upload line by line so it is parsed as it is read
+        lines = (line.decode('utf-8-sig') for line in form.cleaned_data['file'])
+        reports = list(LedgerImporter(self.get_house()).run(lines))
+        return self.render_to_response(self.get_context_data(form=form, reports=reports))
+
+
+class UserOverdueView(LoginRequiredMixin, ListView):
+    template_name = 'houses/overdue_payments.html'
+    login_url = '/login/'
+
+    def get_queryset(self):
+        # Payments can't be joined to houses across shards, so query each
+        # shard for its houses and merge in due date order
+        payments = []
+        houses = House.objects.filter(creator=self.request.user).only('id', 'shard')
+        for shard, shard_houses in houses_by_shard(houses).items():
+            with use_shard(shard):
+                payments.extend(Payment.objects.overdue().filter(
+                    bill__house_id__in=[house.id for house in shard_houses],
+                ))
+        return sorted(payments, key=lambda payment: (payment.bill.due_date, payment.id))
+
+
+class HouseOverdueView(HouseShardMixin, HouseChildrenMixin, ListView):
+    template_name = 'houses/overdue_payments.html'
+
+    def get_queryset(self):
+        return Payment.objects.overdue().filter(bill__house_id=self.get_house().id)
 
     def get_context_data(self, **kwargs):
         context_data = super().get_context_data(**kwargs)
-        obj = self.get_object()
-        context_data['payment_history'] = obj.payment_history()
-        context_data['amounts_owed_from_roommates'] = obj.amounts_owed_from_roommates()
-        context_data['amounts_owed_to_roommates'] = obj.amounts_owed_to_roommates()
+        context_data['house_id'] = self.get_house().id
         return context_data
@@ -1,3 +1,33 @@
+import ast
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .cache import SHARED_CACHE
+
 AUTH_USER_MODEL = 'users.User'
 LOGOUT_REDIRECT_URL = '/login'
 LOGIN_REDIRECT_URL = '/houses'
+
+# Sessions are read on every request. cached_db serves them from the cache
+# and only falls back to the database on a miss; signed_cookies keeps them
+# in the client's cookie and needs no storage at all; db is Django's default.
+SESSION_BACKENDS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cached_db' if SHARED_CACHE else 'db')
+SESSION_ENGINE = SESSION_BACKENDS[SESSION_BACKEND]
+
+# Load request.user from the cache rather than the users table. Entries
+# are dropped on save and logout, so the timeout only bounds changes made
+# without save().
+USER_CACHE = ast.literal_eval(os.environ.get('DJANGO_USER_CACHE', str(SHARED_CACHE)))
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', 60 * 5))
+
+# Logging out, changing a password or deactivating a user only drops the
+# entries in the cache of the worker that handled it, so both need a
+# CACHE_BACKEND every worker shares
+if not SHARED_CACHE and (SESSION_BACKEND == 'cached_db' or USER_CACHE):
+    raise ImproperlyConfigured('cached_db sessions and DJANGO_USER_CACHE need a shared CACHE_BACKEND.')
@@ -15,6 +15,7 @@ import os
 from .auth import *
 from .staticfiles import *
 from .db import *
+from .cache import *
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -38,6 +39,7 @@ ALLOWED_HOSTS = [
 # Application definition
 
 INSTALLED_APPS = [
+    'core.apps.CoreConfig',
     'houses.apps.HousesConfig',
     'users.apps.UsersConfig',
     'django_extensions',
@@ -54,11 +56,21 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware' if USER_CACHE else
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-view query and latency metrics, served at /metrics
+QUERY_METRICS = ast.literal_eval(os.environ.get('DJANGO_QUERY_METRICS', 'False'))
+
+if DATABASE_REPLICAS:
+    MIDDLEWARE_CLASSES.insert(0, 'core.middleware.ReplicaPinMiddleware')
+
+if QUERY_METRICS:
+    MIDDLEWARE_CLASSES.insert(0, 'core.middleware.QueryMetricsMiddleware')
+
 ROOT_URLCONF = 'settings.urls'
 
 TEMPLATES = [
@@ -0,0 +1,37 @@
+import ast
+import os
+
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Backends whose entries only the process that wrote them can see. With
+# several gunicorn workers an invalidation made in one of them never
+# reaches the others, so nothing that must be invalidated can go there.
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+SHARED_CACHE = CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+
+# Rendered house page fragments are keyed by a per-house version that is
+# bumped on every change, so this only bounds how long unused entries live.
+# The bump has to reach every worker, so fragments are only cached when
+# the default cache is shared.
+HOUSE_FRAGMENT_CACHE = ast.literal_eval(os.environ.get('DJANGO_HOUSE_FRAGMENT_CACHE', str(SHARED_CACHE)))
+HOUSE_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('HOUSE_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24))
+CACHES['house_fragments'] = CACHES['default'] if HOUSE_FRAGMENT_CACHE else {
+    'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+}
+# Pages rendered from a read replica may be behind the version they are
+# keyed on, so they read fragments but never store them
+CACHES['house_fragments_replica'] = {
+    'BACKEND': 'core.cache.ReadOnlyCache',
+    'LOCATION': 'house_fragments',
+}
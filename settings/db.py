@@ -1,3 +1,4 @@
+import ast
 import os
 
 # Database
@@ -14,5 +15,55 @@ DATABASES = {
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT'),
         'USER': os.environ.get('DB_USER'),
+        # Seconds to keep a connection open between requests, 0 to close it
+        # after every request and None to keep it forever
+        'CONN_MAX_AGE': ast.literal_eval(os.environ.get('DB_CONN_MAX_AGE', '0')),
+        # Ping reused connections at the start of each request so one the
+        # server or Cloud SQL proxy dropped is replaced, not handed to a view
+        'CONN_HEALTH_CHECKS': ast.literal_eval(os.environ.get('DB_CONN_HEALTH_CHECKS', 'True')),
     }
 }
+
+# Read replicas, as comma-separated hosts and/or database names. Each one
+# copies the primary's settings, so DB_REPLICA_NAMES alone is enough for
+# SQLite files standing in for replicas locally.
+REPLICA_HOSTS = [host for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host]
+REPLICA_NAMES = [name for name in os.environ.get('DB_REPLICA_NAMES', '').split(',') if name]
+DATABASE_REPLICAS = []
+for i in range(max(len(REPLICA_HOSTS), len(REPLICA_NAMES))):
+    alias = 'replica{}'.format(i + 1)
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=REPLICA_HOSTS[i] if i < len(REPLICA_HOSTS) else DATABASES['default']['HOST'],
+        NAME=REPLICA_NAMES[i] if i < len(REPLICA_NAMES) else DATABASES['default']['NAME'],
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+# Shards for house data, as comma-separated database names and optionally
+# hosts, set up like the replicas. Houses and users stay on the primary,
+# which records the shard each house lives on. Every shard hands out row
+# ids from its own block of SHARD_ID_SPAN, so ids stay unique across them.
+SHARD_HOSTS = [host for host in os.environ.get('DB_SHARD_HOSTS', '').split(',') if host]
+SHARD_NAMES = [name for name in os.environ.get('DB_SHARD_NAMES', '').split(',') if name]
+DATABASE_SHARDS = []
+for i in range(max(len(SHARD_HOSTS), len(SHARD_NAMES))):
+    alias = 'shard{}'.format(i + 1)
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=SHARD_HOSTS[i] if i < len(SHARD_HOSTS) else DATABASES['default']['HOST'],
+        NAME=SHARD_NAMES[i] if i < len(SHARD_NAMES) else DATABASES['default']['NAME'],
+    )
+    DATABASE_SHARDS.append(alias)
+
+SHARD_ID_SPAN = int(os.environ.get('DB_SHARD_ID_SPAN', str(10 ** 8)))
+
+DATABASE_ROUTERS = ['houses.sharding.HouseShardRouter', 'core.routers.PrimaryReplicaRouter']
+
+# Seconds a client keeps reading from the primary after it writes, to
+# cover replication lag
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', '5'))
+
+# Open and check every connection when a worker boots rather than on its
+# first request
+DB_WARM_UP = ast.literal_eval(os.environ.get('DB_WARM_UP', 'True'))
@@ -0,0 +1,38 @@
+import ast
+import multiprocessing
+import os
+
+# Gunicorn settings, loaded with gunicorn -c python:settings.gunicorn
+# http://docs.gunicorn.org/en/stable/settings.html
+
+bind = ':{}'.format(os.environ.get('PORT', '8080'))
+
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# More than one thread switches the sync workers to gthread
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+
+# Import the app once in the master, so workers fork with Django set up
+# and the URLs and templates already compiled
+preload_app = ast.literal_eval(os.environ.get('GUNICORN_PRELOAD', 'True'))
+
+
+def when_ready(server):
+    # The master has loaded the app and is about to start the workers
+    if preload_app:
+        from django.db import connections
+        from core.warmup import warm_up
+        warm_up()
+        # Forked workers must not share the master's database connections
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+    if not preload_app:
+        from core.warmup import warm_up
+        warm_up()
+    # Connect from the worker itself, after the fork
+    if settings.DB_WARM_UP:
+        from core.db import warm_up_connections
+        warm_up_connections()
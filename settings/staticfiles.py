@@ -1,10 +1,20 @@
+import ast
 import os
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 STATIC_URL = os.environ.get('STATIC_URL', '/static/')
+STATIC_ROOT = os.environ.get('STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
 GS_BUCKET_NAME = os.environ.get('GS_BUCKET_NAME')
 GS_PROJECT_ID = os.environ.get('GS_PROJECT_ID')
-STATICFILES_STORAGE = os.environ.get('STATICFILES_STORAGE', 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage')
+# Writes gzip and brotli copies next to each hashed text file. On Cloud
+# Storage use core.gcloud.CompressedManifestGoogleCloudStorage, which
+# stores hashed files gzipped and marked immutable instead.
+STATICFILES_STORAGE = os.environ.get('STATICFILES_STORAGE', 'core.storage.CompressedManifestStaticFilesStorage')
+
+# Serve STATIC_ROOT from Django, with precompressed variants and
+# far-future cache headers, for deployments with no server in front
+SERVE_STATIC = ast.literal_eval(os.environ.get('DJANGO_SERVE_STATIC', 'False'))
@@ -13,16 +13,29 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+import re
+
+from django.conf import settings
 from django.conf.urls import url, include
 from django.contrib import admin
 
+from core.views import metrics, serve_static
 from houses.views import HomePageView
 from users.views import UserCreateView
 
 urlpatterns = [
     url(r'^$', HomePageView.as_view(), name='home'),
     url(r'^houses/', include('houses.urls')),
+    url(r'^api/', include('houses.api_urls')),
     url(r'^register', UserCreateView.as_view(), name='user_create'),
     url(r'^', include('django.contrib.auth.urls')),
     url(r'^admin/', admin.site.urls),
 ]
+
+if settings.QUERY_METRICS:
+    urlpatterns.append(url(r'^metrics$', metrics, name='metrics'))
+
+if settings.SERVE_STATIC:
+    urlpatterns.append(
+        url(r'^{}(?P<path>.*)$'.format(re.escape(settings.STATIC_URL.lstrip('/'))), serve_static, name='static'),
+    )
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model, load_backend
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+
+def user_cache_key(user_id):
+    return 'user:{}'.format(user_id)
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def get_cached_user(request):
+    # django.contrib.auth.get_user, with the user row read from the cache
+    # once it has been loaded. Entries are dropped when the user is saved,
+    # deleted or logs out; USER_CACHE_TIMEOUT bounds how stale one can get
+    # through changes that skip save(), like QuerySet.update().
+    try:
+        user_id = get_user_model()._meta.pk.to_python(request.session[SESSION_KEY])
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None or not session_verified(request, user):
+        # Also reload when the session doesn't match, in case the password
+        # was just changed and this cache hasn't heard about it yet
+        user = load_backend(backend_path).get_user(user_id)
+        if user is None or not session_verified(request, user):
+            request.session.flush()
+            return AnonymousUser()
+        cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+    user.backend = backend_path
+    return user
+
+
+def session_verified(request, user):
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    return bool(session_hash) and constant_time_compare(session_hash, user.get_session_auth_hash())
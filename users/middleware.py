@@ -0,0 +1,12 @@
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.functional import SimpleLazyObject
+
+from .cache import get_cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    # Drop-in for AuthenticationMiddleware that loads request.user from the
+    # cache instead of querying the users table on every request
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
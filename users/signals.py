@@ -0,0 +1,17 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_user
+from .models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.id)
+
+
+@receiver(user_logged_out)
+def logged_out_user_changed(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_user(user.id)
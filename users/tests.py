@@ -0,0 +1,87 @@
+from faker import Faker
+
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core import factories
+from users.cache import user_cache_key
+from users.models import User
+
+fake = Faker()
+
+CACHED_USER_MIDDLEWARE = [
+    'users.middleware.CachedAuthenticationMiddleware'
+    if name == 'django.contrib.auth.middleware.AuthenticationMiddleware' else name
+    for name in settings.MIDDLEWARE_CLASSES
+]
+
+
+# A test run is a single process, so its locmem cache stands in for a shared one
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db', MIDDLEWARE_CLASSES=CACHED_USER_MIDDLEWARE)
+class CachedUserLookup(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = factories.create_fake_user()
+        self.client.force_login(self.user)
+        self.client.get(reverse('home'))
+
+    def test_repeat_requests_skip_session_and_user_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_saving_the_user_invalidates_the_cache(self):
+        self.user.first_name = fake.first_name()
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['user'].first_name, self.user.first_name)
+
+    def test_logging_out_invalidates_the_cache(self):
+        self.client.logout()
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
+
+    def test_password_changed_elsewhere_keeps_the_session(self):
+        # The password changed without this process hearing about it, and
+        # the session was updated with the new hash
+        User.objects.filter(id=self.user.id).update(password=make_password(fake.password()))
+        session = self.client.session
+        session[HASH_SESSION_KEY] = User.objects.get(id=self.user.id).get_session_auth_hash()
+        session.save()
+        response = self.client.get(reverse('home'))
+        self.assertTrue(response.context['user'].is_authenticated)
+
+    def test_stale_session_is_logged_out(self):
+        session = self.client.session
+        session[HASH_SESSION_KEY] = 'stale'
+        session.save()
+        response = self.client.get(reverse('home'))
+        self.assertFalse(response.context['user'].is_authenticated)
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+    MIDDLEWARE_CLASSES=CACHED_USER_MIDDLEWARE,
+)
+class SignedCookieSessions(TestCase):
+    def test_repeat_requests_skip_session_and_user_queries(self):
+        cache.clear()
+        user = factories.create_fake_user()
+        self.client.force_login(user)
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['user'], user)
+
+
+class ProcessLocalCacheDefaults(SimpleTestCase):
+    def test_sessions_and_users_are_not_cached(self):
+        # The test settings use locmem, which other workers can't see
+        self.assertFalse(settings.SHARED_CACHE)
+        self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+        self.assertFalse(settings.USER_CACHE)
+        self.assertIn('django.contrib.auth.middleware.AuthenticationMiddleware', settings.MIDDLEWARE_CLASSES)